@@ -0,0 +1,164 @@
+"""
+Synthetic data for the niio benchmarks.
+
+Run with:
+
+    $ python -m pytest benchmarks
+
+By default, fixtures use a 32k-vertex mesh with 1 and 10 arrays.  Set
+NIIO_BENCH_LARGE=1 to also benchmark 164k-vertex meshes and 1200 arrays,
+which needs several GB of disk space and memory.
+"""
+
+import multiprocessing
+import os
+import pickle
+import sys
+import tracemalloc
+
+import h5py
+import numpy as np
+import pytest
+import scipy.io as sio
+
+from niio import write
+
+
+SMALL = [(32492, 1), (32492, 10)]
+LARGE = [(163842, 1), (163842, 10), (32492, 1200), (163842, 1200)]
+
+SIZES = SMALL + (LARGE if os.environ.get('NIIO_BENCH_LARGE') else [])
+
+
+def size_id(size):
+
+    return '{}x{}'.format(*size)
+
+
+@pytest.fixture(scope='session', params=SIZES, ids=size_id)
+def array(request):
+
+    """
+    Random (vertices, arrays) float32 data.
+    """
+
+    rows, columns = request.param
+    rng = np.random.RandomState(0)
+
+    return rng.rand(rows, columns).astype(np.float32).squeeze()
+
+
+@pytest.fixture(scope='session')
+def files(array, tmp_path_factory):
+
+    """
+    The same array saved in every format niio reads.
+    """
+
+    root = tmp_path_factory.mktemp('bench')
+    columns = array.T.tolist() if array.ndim > 1 else array
+
+    paths = {'gii': str(root / 'data.func.gii'),
+             'mat': str(root / 'data.mat'),
+             'mat73': str(root / 'data73.mat'),
+             'h5': str(root / 'data.h5'),
+             'p': str(root / 'data.p')}
+
+    write.save(columns, paths['gii'], 'L')
+    sio.savemat(paths['mat'], {'data': array})
+    with h5py.File(paths['mat73'], 'w') as h5:
+        h5.create_dataset('data', data=array.T)
+    write.save_h5(array, paths['h5'])
+    with open(paths['p'], 'wb') as f:
+        pickle.dump(array, f)
+
+    return paths
+
+
+@pytest.fixture(scope='session')
+def mesh():
+
+    """
+    Random 164k-vertex mesh with the face count of a closed surface.
+    """
+
+    rng = np.random.RandomState(0)
+    vertices = rng.rand(163842, 3).astype(np.float32)
+    faces = rng.randint(0, 163842, size=(327680, 3)).astype(np.int32)
+
+    return vertices, faces
+
+
+def measure(benchmark, func, nbytes, *args, **kwargs):
+
+    """
+    Benchmark func, recording throughput and peak memory of one extra call.
+
+    peak_traced_bytes is measured with tracemalloc, which only sees Python
+    and numpy allocations.  peak_rss_bytes also counts memory allocated in C
+    libraries -- HDF5, zlib, expat -- and is measured in a forked child
+    process, so it is missing where fork is not available.
+
+    Timing statistics are skipped with --benchmark-disable, which runs func
+    once as a smoke test.
+    """
+
+    result = benchmark(func, *args, **kwargs)
+
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    benchmark.extra_info['nbytes'] = int(nbytes)
+    benchmark.extra_info['peak_traced_bytes'] = peak
+
+    rss = peak_rss(func, *args, **kwargs)
+    if rss is not None:
+        benchmark.extra_info['peak_rss_bytes'] = rss
+
+    if benchmark.stats is not None:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info['MB/s'] = nbytes / 2**20 / mean
+
+    return result
+
+
+def peak_rss(func, *args, **kwargs):
+
+    """
+    Increase in peak resident memory over one call of func, in bytes.
+
+    func runs in a forked child, whose peak resident size starts at that of
+    the benchmark process, so the increase is the memory func itself needs.
+    Returns None where fork or the resource module are not available, or if
+    func fails.
+    """
+
+    try:
+        import resource
+        context = multiprocessing.get_context('fork')
+    except (ImportError, ValueError):
+        return None
+
+    # ru_maxrss is in bytes on macOS, and kilobytes elsewhere
+    unit = 1 if sys.platform == 'darwin' else 1024
+
+    def child(conn):
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func(*args, **kwargs)
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send((after - before) * unit)
+
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=child, args=(sender,))
+    process.start()
+    sender.close()
+
+    try:
+        rss = receiver.recv()
+    except EOFError:
+        rss = None
+    process.join()
+
+    return rss
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from niio import loaded
+
+from conftest import measure
+
+
+@pytest.mark.parametrize('fmt', ['gii', 'mat', 'mat73', 'h5', 'p'])
+def test_load(benchmark, files, array, fmt):
+    "Load a whole file with loaded.load."
+    benchmark.group = 'load-{}'.format(fmt)
+    measure(benchmark, loaded.load, array.nbytes, files[fmt])
+
+
+def test_load_gii_single(benchmark, files, array):
+    "Load a single DataArray from a GIFTI file."
+    benchmark.group = 'load-gii-single'
+    nbytes = array.nbytes // (array.shape[1] if array.ndim > 1 else 1)
+    measure(benchmark, loaded.loadGii, nbytes, files['gii'], datasets=[0])
+
+
+def test_load_gii_out(benchmark, files, array):
+    "Load a GIFTI file into a reused output buffer."
+    benchmark.group = 'load-gii-out'
+    out = np.empty_like(array)
+    measure(benchmark, loaded.loadGii, array.nbytes, files['gii'], out=out)
+
+
+def test_load_h5_rows(benchmark, files, array):
+    "Read 100 rows of an hdf5 file through a lazy proxy."
+    benchmark.group = 'load-h5-rows'
+
+    def rows():
+        with loaded.loadH5(files['h5'], lazy=True) as h5:
+            return h5['data'][1000:1100]
+
+    measure(benchmark, rows, array[1000:1100].nbytes)
+
+
+@pytest.mark.parametrize('cache', [False, True], ids=['parse', 'cached'])
+def test_load_surf(benchmark, mesh, tmp_path, cache):
+    "Load a GIFTI surface with loaded.loadSurf."
+    from niio import write
+
+    surface = str(tmp_path / 'mesh.surf.gii')
+    write.save_surf(*mesh, surface, 'CortexLeft')
+    benchmark.group = 'load-surf'
+    measure(benchmark, loaded.loadSurf, mesh[0].nbytes + mesh[1].nbytes,
+            surface, cache=cache)
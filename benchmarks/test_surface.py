@@ -0,0 +1,52 @@
+import numpy as np
+
+from niio import surface
+
+from conftest import measure
+
+
+def test_adjacency(benchmark, mesh):
+    "Build the vertex adjacency matrix of a 164k-vertex mesh."
+    benchmark.group = 'surface-adjacency'
+
+    def adjacency():
+        return surface.Surface(*mesh).adjacency
+
+    measure(benchmark, adjacency, mesh[1].nbytes)
+
+
+def test_vertex_geometry(benchmark, mesh):
+    "Compute vertex areas and normals of a 164k-vertex mesh."
+    benchmark.group = 'surface-geometry'
+
+    def geometry():
+        surf = surface.Surface(*mesh)
+        return surf.vertex_areas, surf.vertex_normals
+
+    measure(benchmark, geometry, mesh[0].nbytes + mesh[1].nbytes)
+
+
+def test_kring(benchmark, mesh):
+    "Find the 2-ring of 10,000 vertices of a 164k-vertex mesh."
+    benchmark.group = 'surface-kring'
+    surf = surface.Surface(*mesh)
+    seeds = np.arange(0, len(mesh[0]), len(mesh[0]) // 10000)
+    measure(benchmark, surf.kring, seeds.nbytes, seeds, 2)
+
+
+def test_nearest(benchmark, mesh):
+    "Find the nearest vertex to 100,000 points."
+    benchmark.group = 'surface-nearest'
+    surf = surface.Surface(*mesh)
+    points = np.random.RandomState(1).rand(100000, 3)
+    measure(benchmark, surf.nearest, points.nbytes, points)
+
+
+def test_smooth(benchmark, mesh, array):
+    "Smooth (vertices, arrays) data on a 32k-vertex subset of the mesh."
+    benchmark.group = 'surface-smooth'
+    rows = array.shape[0]
+    faces = mesh[1][(mesh[1] < rows).all(1)]
+    smoother = surface.Surface(mesh[0][:rows], faces).smoother(
+        'neighbor', iterations=10)
+    measure(benchmark, smoother.apply, array.nbytes, array)
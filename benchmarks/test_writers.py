@@ -0,0 +1,42 @@
+import pytest
+
+from niio import convert, write
+
+from conftest import measure
+
+
+def test_save(benchmark, array, tmp_path):
+    "Save a (vertices, arrays) matrix with write.save."
+    benchmark.group = 'save-gii'
+    columns = array.T.tolist() if array.ndim > 1 else array
+    measure(benchmark, write.save, array.nbytes, columns,
+            str(tmp_path / 'out.func.gii'), 'L')
+
+
+def test_save_h5(benchmark, array, tmp_path):
+    "Save a (vertices, arrays) matrix with write.save_h5."
+    benchmark.group = 'save-h5'
+    measure(benchmark, write.save_h5, array.nbytes, array,
+            str(tmp_path / 'out.h5'))
+
+
+def test_save_surf(benchmark, mesh, tmp_path):
+    "Save a 164k-vertex mesh with write.save_surf."
+    benchmark.group = 'save-surf'
+    measure(benchmark, write.save_surf, mesh[0].nbytes + mesh[1].nbytes,
+            *mesh, str(tmp_path / 'out.surf.gii'), 'CortexLeft')
+
+
+def test_mat2func(benchmark, files, array, tmp_path):
+    "Convert a .mat file to GIFTI."
+    benchmark.group = 'mat2func'
+    measure(benchmark, convert.mat2func, array.nbytes, files['mat'],
+            str(tmp_path / 'out.func.gii'), 'L')
+
+
+@pytest.mark.parametrize('stream', [False, True], ids=['v5', 'v73-stream'])
+def test_func2mat(benchmark, files, array, tmp_path, stream):
+    "Convert a GIFTI file to .mat."
+    benchmark.group = 'func2mat'
+    measure(benchmark, convert.func2mat, array.nbytes, files['gii'],
+            str(tmp_path / 'out.mat'), stream=stream)
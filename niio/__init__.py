@@ -2,4 +2,23 @@ from ._version import get_versions
 __version__ = get_versions()['version']
 del get_versions
 
-from . import (convert, loaded, structures, tables, write)
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first access, so that e.g. reading a GIFTI file
+# with niio.loaded does not import matplotlib, pandas, scipy.io or h5py.
+__all__ = ['caching', 'convert', 'geometry', 'gifti', 'handles', 'loaded',
+           'smoothing', 'structures', 'surface', 'tables', 'write']
+
+
+def __getattr__(name):
+
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+
+    return sorted(list(globals()) + __all__)
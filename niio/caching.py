@@ -0,0 +1,339 @@
+"""
+Cache of decoded arrays returned by loaded.load.
+
+Entries are keyed on the real path, size and modification time of the
+source file, together with the keyword arguments passed to the loader, so
+a file that changes on disk is never served stale.  Arrays are kept in
+memory under a byte budget with least-recently-used eviction, and can
+optionally be written to a directory of .npy files, where other processes
+find them.  The directory has its own byte budget, and its least recently
+used files are removed to stay within it, which also clears out the files
+of sources that have since changed.
+
+Arrays kept in memory are shared between callers, and are therefore
+read-only.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+class ResultCache(object):
+
+    """
+    Byte-bounded, least-recently-used cache of loaded arrays.
+    """
+
+    def __init__(self, max_bytes=2**30, cache_dir=None, max_disk_bytes=2**32):
+
+        """
+        Instantiate ResultCache object.
+
+        Parameters:
+        - - - - -
+        max_bytes: int
+            maximum number of bytes of array data kept in memory
+        cache_dir: str
+            directory in which to also store arrays as .npy files.  If None,
+            arrays are only cached in memory.
+        max_disk_bytes: int
+            maximum number of bytes of .npy files kept in cache_dir
+        """
+
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def fetch(self, datafile, loader, **kwargs):
+
+        """
+        Get the result of loader(datafile, **kwargs), loading it only if it
+        is not already cached.
+
+        Parameters:
+        - - - - -
+        datafile: str
+            file to load
+        loader: function
+            method used to load the file on a cache miss
+        kwargs: dict
+            keyword arguments passed to loader
+
+        Returns:
+        - - - -
+        result: array, or dictionary of arrays
+            loaded data, read-only if it is kept in memory.  Results that
+            are not arrays are returned as-is and not cached.  Loads into a
+            caller's out buffer bypass the cache, so that the buffer stays
+            writable.
+        """
+
+        if kwargs.get('out') is not None:
+            return loader(datafile, **kwargs)
+
+        key = make_key(datafile, kwargs)
+
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        result = loader(datafile, **kwargs)
+        self.put(key, result)
+
+        return result
+
+    def get(self, key):
+
+        """
+        Get a cached result by key, or None if missing.
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        ondisk = self._path(key)
+        if ondisk is not None and os.path.exists(ondisk):
+            try:
+                result = np.load(ondisk, mmap_mode='r')
+            except (OSError, ValueError):
+                # unreadable, e.g. an array of Python objects written by an
+                # older version, so remove it and load the source again
+                result = None
+                _remove(ondisk)
+            if result is not None:
+                # mark the file as recently used, for pruning
+                try:
+                    os.utime(ondisk)
+                except OSError:
+                    pass
+                with self._lock:
+                    self.hits += 1
+                self._store(key, result)
+                return result
+
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key, result):
+
+        """
+        Cache a result.  Arrays, and dictionaries of arrays, kept in memory
+        are made read-only in place.  Any other result is ignored.
+        """
+
+        if not isinstance(result, np.ndarray) and not (
+                isinstance(result, dict) and result and all(
+                    isinstance(v, np.ndarray) for v in result.values())):
+            return
+
+        self._store(key, result)
+
+        # arrays of Python objects cannot be memory-mapped back
+        ondisk = self._path(key)
+        if ondisk is not None and isinstance(result, np.ndarray) and \
+                not result.dtype.hasobject:
+            # write to temporary file first, so that other processes never
+            # see a partially written array
+            fd, tmp = tempfile.mkstemp(suffix='.npy', dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, result)
+            os.replace(tmp, ondisk)
+
+            self._prune()
+
+    def clear(self, disk=False):
+
+        """
+        Remove all in-memory entries.
+
+        Parameters:
+        - - - - -
+        disk: bool
+            also remove all .npy files from the cache directory
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+        if disk and self.cache_dir is not None:
+            for f in os.listdir(self.cache_dir):
+                if f.endswith('.npy'):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+    def _prune(self):
+
+        """
+        Remove the least recently used .npy files from the cache directory
+        until it is within its byte budget.
+        """
+
+        files = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime_ns, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.disk_evictions += 1
+
+    def stats(self):
+
+        """
+        Get cache usage statistics.
+
+        Returns:
+        - - - -
+        stats: dict
+            hits, misses, evictions, number of entries and bytes in memory,
+            and files removed from the cache directory
+        """
+
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'disk_evictions': self.disk_evictions,
+                    'entries': len(self._entries),
+                    'nbytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
+
+    def _store(self, key, result):
+
+        """
+        Add a result to memory, evicting old entries to stay within budget.
+        Stored arrays are made read-only.
+        """
+
+        size = _nbytes(result)
+        if size > self.max_bytes:
+            return
+
+        arrays = result.values() if isinstance(result, dict) else [result]
+        for array in arrays:
+            array.flags.writeable = False
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= _nbytes(self._entries.pop(key))
+
+            self._entries[key] = result
+            self.nbytes += size
+
+            while self.nbytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.nbytes -= _nbytes(old)
+                self.evictions += 1
+
+    def _path(self, key):
+
+        if self.cache_dir is None:
+            return None
+
+        return os.path.join(self.cache_dir, key + '.npy')
+
+
+def make_key(datafile, kwargs):
+
+    """
+    Compute the cache key of a file and set of loader arguments.
+
+    Parameters:
+    - - - - -
+    datafile: str
+        file to load
+    kwargs: dict
+        keyword arguments passed to loader
+
+    Returns:
+    - - - -
+    key: str
+        hexadecimal digest
+    """
+
+    stat = os.stat(datafile)
+    args = sorted((k, _freeze(v)) for k, v in kwargs.items())
+    token = repr((os.path.realpath(datafile), stat.st_size,
+                  stat.st_mtime_ns, args))
+
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+def _freeze(value):
+
+    """
+    Representation of an argument that does not truncate arrays.
+    """
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    return value
+
+
+def _remove(path):
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _nbytes(result):
+
+    if isinstance(result, dict):
+        return sum(v.nbytes for v in result.values())
+
+    return result.nbytes
+
+
+default = None
+
+
+def get_default():
+
+    """
+    Get the shared cache used by loaded.load(..., cache=True), creating
+    it on first use.
+    """
+
+    global default
+
+    if default is None:
+        default = ResultCache()
+
+    return default
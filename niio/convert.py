@@ -1,7 +1,14 @@
-from niio import loaded, write
+from niio import gifti, handles, loaded, write
 import numpy as np
 import scipy.io as sio
 
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import inspect
+import os
+import pickle
+import sys
+
 def mat2func(in_mat, out_func, hemisphere):
 
     """
@@ -10,6 +17,9 @@ def mat2func(in_mat, out_func, hemisphere):
     each column (dimension) will be saved as a DataArray object in the
     Gifti file.
 
+    Columns of v7.3 (hdf5) .mat files are read and written one at a time,
+    so memory use does not grow with the number of columns.
+
     Parameters:
     - - - - -
     in_mat: str
@@ -18,16 +28,57 @@ def mat2func(in_mat, out_func, hemisphere):
         Gifti .func.gii to create
     """
 
-    mat = loaded.load(in_mat)
-    mat = mat.squeeze()
+    columns, count = _mat_columns(in_mat)
+    write.save(columns, out_func, hemisphere, count=count)
+
+
+def _mat_columns(in_mat):
+
+    """
+    Generator of the columns of the first non-private variable of a .mat
+    file, and the number of columns.
+    """
+
+    try:
+        h5 = handles.pool.acquire(in_mat)
+    except OSError:
+        # v5 files cannot be read partially
+        mat = loaded.loadMat(in_mat)
+        if mat.ndim < 2:
+            return iter([mat]), 1
+        return (mat[:, i] for i in range(mat.shape[1])), mat.shape[1]
+
+    try:
+        key = [k for k in h5.keys() if not k.startswith('_')][0]
+        shape = h5[key].shape
+    finally:
+        handles.pool.release(h5)
 
-    if mat.ndim > 1:
-        mat = mat.T.tolist()
+    # hdf5 datasets are the transpose of the Matlab matrix, so Matlab
+    # columns are contiguous dataset rows
+    if len([s for s in shape if s > 1]) < 2:
+        count = 1
+    else:
+        count = shape[0]
 
-    write.save(mat, out_func, hemisphere)
+    def columns():
+        # acquired on the first column, so that a generator that is never
+        # started does not hold the handle
+        h5 = handles.pool.acquire(in_mat)
+        try:
+            data = h5[key]
+            if count == 1:
+                yield np.asarray(data).squeeze()
+            else:
+                for i in range(count):
+                    yield data[i]
+        finally:
+            handles.pool.release(h5)
 
+    return columns(), count
 
-def func2mat(in_func, out_mat):
+
+def func2mat(in_func, out_mat, stream=False):
     """
     Method to quickly convert between Matlab .mat and Gifti .func.gii files.
 
@@ -37,10 +88,403 @@ def func2mat(in_func, out_mat):
         Gifti .func.gii or .label.gii file to convert
     out_mat: str
         Matlab .mat file to generate
+    stream: bool
+        if True, decode and write one DataArray at a time, to a v7.3
+        (hdf5) .mat file, which scipy.io.loadmat cannot read.  By default,
+        load the whole file and save it with scipy.io.savemat, which writes
+        v5 files.
     """
 
+    if stream:
+        count = gifti.count_darrays(in_func)
+        columns = (d.squeeze() for _, d in gifti.iter_darrays(in_func))
+        write.save_mat73(columns, count, out_mat)
+        return
+
     func = loaded.load(in_func)
     func = func.squeeze()
 
     mat = {'data': func}
     sio.savemat(out_mat, mat)
+
+
+def func2external(in_func, out_func):
+
+    """
+    Method to rewrite a Gifti file with its data stored in an external
+    binary file, out_func + '.dat'.  The DataArrays of the new file can be
+    memory-mapped with loaded.loadGii(out_func, mmap=True).
+
+    Parameters:
+    - - - - -
+    in_func: str
+        Gifti .func.gii or .label.gii file to convert
+    out_func: str
+        Gifti file to generate
+    """
+
+    import nibabel as nb
+
+    gii = nb.load(in_func)
+    write._write_gifti(out_func, gii.darrays, gii.meta, 'ExternalFileBinary',
+                       labeltable=gii.labeltable)
+
+
+def convert(src, dst, **opts):
+
+    """
+    Method to convert between any two supported file formats, chosen by
+    file extension.
+
+    Data is treated as a (vertices, columns) matrix.  Where both formats
+    support it (.mat v7.3, .gii, .h5, .npy), columns are passed from reader
+    to writer one at a time, or in small blocks, rather than loading the
+    whole matrix.
+
+    Parameters:
+    - - - - -
+    src: str
+        file to convert
+    dst: str
+        file to generate
+    opts: dict
+        passed to the writer, e.g. hemisphere='L', which Gifti files
+        require
+
+    Example:
+    - - - -
+    >>> convert('rest.mat', 'rest.func.gii', hemisphere='L')
+    """
+
+    reader = READERS[os.path.splitext(src)[1]]
+    writer = WRITERS[os.path.splitext(dst)[1]]
+
+    columns, count = reader(src)
+    writer(columns, count, dst, **opts)
+
+
+def register(extension, reader=None, writer=None):
+
+    """
+    Method to add support for a file format to convert.
+
+    Parameters:
+    - - - - -
+    extension: str
+        file extension, including the leading period
+    reader: function
+        reader(path) returns a tuple of an iterator of 1-dimensional
+        columns, and the number of columns
+    writer: function
+        writer(columns, count, path, **opts) saves the columns
+    """
+
+    if reader is not None:
+        READERS[extension] = reader
+    if writer is not None:
+        WRITERS[extension] = writer
+
+
+def _gii_columns(in_func):
+
+    count = gifti.count_darrays(in_func)
+
+    return (d.squeeze() for _, d in gifti.iter_darrays(in_func)), count
+
+
+def _h5_columns(in_h5, dataset=None):
+
+    h5 = handles.pool.acquire(in_h5)
+    try:
+        key = dataset or list(h5.keys())[0]
+        shape = h5[key].shape
+    finally:
+        handles.pool.release(h5)
+    count = shape[1] if len(shape) > 1 else 1
+
+    def columns():
+        # acquired on the first column, as in _mat_columns
+        h5 = handles.pool.acquire(in_h5)
+        try:
+            data = h5[key]
+            if len(shape) < 2:
+                yield np.asarray(data)
+                return
+            # read blocks of columns, so that each chunk is decompressed
+            # once per block rather than once per column
+            width = _block_width(shape[0], data.dtype.itemsize)
+            for start in range(0, count, width):
+                block = data[:, start:start+width]
+                for column in block.T:
+                    yield column
+        finally:
+            handles.pool.release(h5)
+
+    return columns(), count
+
+
+def _npy_columns(in_npy):
+
+    data = loaded.loadNpy(in_npy, mmap_mode='r')
+    if data.ndim < 2:
+        return iter([data]), 1
+
+    return (data[:, i] for i in range(data.shape[1])), data.shape[1]
+
+
+def _pick_columns(in_pick):
+
+    data = np.asarray(loaded.loadPick(in_pick))
+    if data.ndim < 2:
+        return iter([data]), 1
+
+    return (data[:, i] for i in range(data.shape[1])), data.shape[1]
+
+
+def _write_gii(columns, count, out_func, hemisphere=None, **opts):
+
+    if hemisphere not in ['L', 'R']:
+        raise ValueError("Gifti outputs need a hemisphere, 'L' or 'R'.")
+
+    write.save(columns, out_func, hemisphere, count=count, **opts)
+
+
+def _write_mat(columns, count, out_mat, **opts):
+
+    write.save_mat73(columns, count, out_mat, **opts)
+
+
+def _write_h5(columns, count, out_h5, dataset='data', compression='gzip'):
+
+    import h5py
+
+    handles.discard(out_h5)
+
+    with h5py.File(out_h5, 'w') as h5:
+
+        data = None
+        block = []
+        start = 0
+        for column in columns:
+
+            column = np.asarray(column).ravel()
+            if data is None:
+                rows = column.size
+                width = min(count, _block_width(rows, column.itemsize))
+                shape = (rows, count) if count > 1 else (rows,)
+                chunks = (min(rows, 4096), width) if count > 1 else None
+                data = h5.create_dataset(dataset, shape=shape,
+                                         dtype=column.dtype, chunks=chunks,
+                                         compression=compression)
+                if count == 1:
+                    data[:] = column
+                    continue
+
+            # write whole blocks of columns, each spanning one chunk column
+            block.append(column)
+            if len(block) == width:
+                data[:, start:start+width] = np.column_stack(block)
+                start += width
+                block = []
+
+        if block:
+            data[:, start:] = np.column_stack(block)
+
+
+def _write_npy(columns, count, out_npy):
+
+    data = None
+    for i, column in enumerate(columns):
+
+        column = np.asarray(column).ravel()
+        if data is None:
+            shape = (column.size, count) if count > 1 else (column.size,)
+            data = np.lib.format.open_memmap(out_npy, mode='w+',
+                                             dtype=column.dtype, shape=shape)
+        if count > 1:
+            data[:, i] = column
+        else:
+            data[:] = column
+
+    data.flush()
+
+
+def _write_pick(columns, count, out_pick):
+
+    data = np.column_stack(list(columns)).squeeze()
+    with open(out_pick, 'wb') as f:
+        pickle.dump(data, f)
+
+
+def _block_width(rows, itemsize, nbytes=2**26):
+
+    """
+    Number of columns in a block of about nbytes.
+    """
+
+    return max(1, nbytes // max(rows * itemsize, 1))
+
+
+READERS = {'.gii': _gii_columns,
+           '.h5': _h5_columns,
+           '.mat': _mat_columns,
+           '.npy': _npy_columns,
+           '.p': _pick_columns}
+
+WRITERS = {'.gii': _write_gii,
+           '.h5': _write_h5,
+           '.mat': _write_mat,
+           '.npy': _write_npy,
+           '.p': _write_pick}
+
+
+def convert_tree(src, dst, src_ext, dst_ext, workers=None, force=False,
+                 **opts):
+
+    """
+    Method to convert every file with a given extension in a directory
+    tree, mirroring the tree structure in the output directory.
+
+    Files whose output exists and is newer than the input are skipped.
+
+    Parameters:
+    - - - - -
+    src: str
+        input directory
+    dst: str
+        output directory
+    src_ext: str
+        extension of files to convert, e.g. '.mat'
+    dst_ext: str
+        extension of files to generate, e.g. '.func.gii'
+    workers: int
+        number of processes
+    force: bool
+        convert files even if their output is up to date
+    opts: dict
+        passed to convert
+
+    Returns:
+    - - - -
+    results: dict
+        lists of 'converted', 'skipped' and 'failed' input files
+    """
+
+    jobs = []
+    results = {'converted': [], 'skipped': [], 'failed': []}
+
+    for root, _, files in os.walk(src):
+        for f in sorted(files):
+            if not f.endswith(src_ext):
+                continue
+
+            infile = os.path.join(root, f)
+            outfile = os.path.join(dst, os.path.relpath(root, src),
+                                   f[:-len(src_ext)] + dst_ext)
+
+            if not force and _up_to_date(infile, outfile):
+                results['skipped'].append(infile)
+            else:
+                os.makedirs(os.path.dirname(outfile), exist_ok=True)
+                jobs.append((infile, outfile))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(i, o, pool.submit(convert, i, o, **opts))
+                   for i, o in jobs]
+        for infile, outfile, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                results['failed'].append((infile, repr(e)))
+                # a partial output would otherwise look up to date
+                if os.path.exists(outfile):
+                    os.remove(outfile)
+            else:
+                results['converted'].append(infile)
+
+    return results
+
+
+def _up_to_date(infile, outfile):
+
+    return (os.path.exists(outfile) and
+            os.path.getmtime(outfile) >= os.path.getmtime(infile))
+
+
+def main(argv=None):
+
+    """
+    Command line entry point for converting files or directory trees.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='niio-convert',
+        description='Convert between .mat, .gii, .h5, .npy and pickle files.')
+    parser.add_argument('src', help='input file or directory')
+    parser.add_argument('dst', help='output file or directory')
+    parser.add_argument('--from', dest='src_ext',
+                        help='extension of input files, if src is a directory')
+    parser.add_argument('--to', dest='dst_ext',
+                        help='extension of output files, if src is a directory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes')
+    parser.add_argument('--force', action='store_true',
+                        help='convert files whose output is up to date')
+    parser.add_argument('--hemisphere', choices=['L', 'R'],
+                        help='hemisphere, for Gifti outputs')
+
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.src):
+        if not (args.src_ext and args.dst_ext):
+            parser.error('--from and --to are required when src is a '
+                         'directory')
+        source = os.path.splitext('x' + args.src_ext)[1]
+        extension = os.path.splitext('x' + args.dst_ext)[1]
+    else:
+        source = os.path.splitext(args.src)[1]
+        extension = os.path.splitext(args.dst)[1]
+
+    if source not in READERS:
+        parser.error('cannot read {} files'.format(source))
+
+    writer = WRITERS.get(extension)
+    if writer is None:
+        parser.error('cannot write {} files'.format(extension))
+
+    # only pass options to writers that take them
+    opts = {}
+    if _accepts(writer, 'hemisphere'):
+        if not args.hemisphere:
+            parser.error('--hemisphere is required for {} outputs'.format(
+                extension))
+        opts['hemisphere'] = args.hemisphere
+
+    if not os.path.isdir(args.src):
+        if args.force or not _up_to_date(args.src, args.dst):
+            convert(args.src, args.dst, **opts)
+        return 0
+
+    results = convert_tree(args.src, args.dst, args.src_ext, args.dst_ext,
+                           workers=args.workers, force=args.force, **opts)
+
+    for infile, error in results['failed']:
+        print('{}: {}'.format(infile, error), file=sys.stderr)
+    print('{} converted, {} skipped, {} failed'.format(
+        len(results['converted']), len(results['skipped']),
+        len(results['failed'])))
+
+    return 1 if results['failed'] else 0
+
+
+def _accepts(func, name):
+
+    """
+    Check whether a function takes a named keyword argument.
+    """
+
+    return name in inspect.signature(func).parameters
+
+
+if __name__ == '__main__':
+    sys.exit(main())
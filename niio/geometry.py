@@ -0,0 +1,182 @@
+"""
+Vectorized geometry of triangle meshes.
+
+Every function takes the (n_vertices, 3) vertices and (n_faces, 3) faces
+returned by loaded.loadSurf, and works on all faces at once: cross products
+are batched over faces, and per-face quantities are scattered onto vertices
+with np.bincount.  surface.Surface memoizes the results per mesh.
+"""
+
+import numpy as np
+
+
+def _cross(vertices, faces):
+
+    """
+    Cross products of the two edges leaving the first corner of each face.
+    Their length is twice the face area, and their direction the face
+    normal.
+    """
+
+    v = np.asarray(vertices, dtype=np.float64)
+    f = np.asarray(faces)
+
+    a = v[f[:, 0]]
+
+    return np.cross(v[f[:, 1]] - a, v[f[:, 2]] - a)
+
+
+def _scatter(faces, weights, n_vertices):
+
+    """
+    Sum per-face weights onto the three vertices of each face.
+    """
+
+    return np.bincount(np.asarray(faces).ravel(),
+                       weights=np.repeat(weights, 3), minlength=n_vertices)
+
+
+def _normalize(X):
+
+    norms = np.sqrt(np.einsum('ij,ij->i', X, X))
+    norms[norms == 0] = 1
+
+    return X / norms[:, None]
+
+
+def face_areas(vertices, faces):
+
+    """
+    Compute the area of each face.
+
+    Parameters:
+    - - - - -
+    vertices: float, array
+        (n_vertices, 3) array of mesh vertices
+    faces: int, array
+        (n_faces, 3) array of mesh triangles
+
+    Returns:
+    - - - -
+    areas: float, array
+        (n_faces,) face areas
+    """
+
+    C = _cross(vertices, faces)
+
+    return 0.5 * np.sqrt(np.einsum('ij,ij->i', C, C))
+
+
+def face_normals(vertices, faces):
+
+    """
+    Compute the unit normal of each face.  Degenerate faces get a zero
+    normal.
+
+    Parameters:
+    - - - - -
+    vertices: float, array
+        (n_vertices, 3) array of mesh vertices
+    faces: int, array
+        (n_faces, 3) array of mesh triangles
+
+    Returns:
+    - - - -
+    normals: float, array
+        (n_faces, 3) unit face normals
+    """
+
+    return _normalize(_cross(vertices, faces))
+
+
+def vertex_areas(vertices, faces, areas=None):
+
+    """
+    Compute the area of each vertex, as one third of the area of the faces
+    around it.  Vertex areas sum to the area of the mesh.
+
+    Parameters:
+    - - - - -
+    vertices: float, array
+        (n_vertices, 3) array of mesh vertices
+    faces: int, array
+        (n_faces, 3) array of mesh triangles
+    areas: float, array
+        precomputed face areas
+
+    Returns:
+    - - - -
+    areas: float, array
+        (n_vertices,) vertex areas
+    """
+
+    if areas is None:
+        areas = face_areas(vertices, faces)
+
+    return _scatter(faces, areas, len(vertices)) / 3.
+
+
+def vertex_normals(vertices, faces):
+
+    """
+    Compute the unit normal of each vertex, as the area-weighted mean of the
+    normals of the faces around it.  Vertices in no face get a zero normal.
+
+    Parameters:
+    - - - - -
+    vertices: float, array
+        (n_vertices, 3) array of mesh vertices
+    faces: int, array
+        (n_faces, 3) array of mesh triangles
+
+    Returns:
+    - - - -
+    normals: float, array
+        (n_vertices, 3) unit vertex normals
+    """
+
+    # unnormalized cross products are already weighted by face area
+    C = _cross(vertices, faces)
+    N = np.column_stack([_scatter(faces, C[:, i], len(vertices))
+                         for i in range(3)])
+
+    return _normalize(N)
+
+
+def parcel_areas(areas, index_map):
+
+    """
+    Compute the surface area of each parcel.
+
+    Parameters:
+    - - - - -
+    areas: float, array
+        (n_vertices,) vertex areas, e.g. Surface.vertex_areas
+    index_map: dictionary, ParcelIndex or ParcelImage
+        mapping of parcel names to arrays of vertex indices, or a
+        precomputed index of the same parcellation
+
+    Returns:
+    - - - -
+    areas: pandas Series
+        area of each parcel, indexed by parcel name
+    """
+
+    import pandas
+    from niio import structures
+
+    areas = np.asarray(areas)
+
+    if isinstance(index_map, dict):
+        index_map = structures.ParcelIndex(index_map, rows=len(areas))
+
+    labels = index_map.labels
+    if len(labels) != len(areas):
+        raise ValueError('Parcellation has {} vertices, but areas has '
+                         '{}.'.format(len(labels), len(areas)))
+
+    valid = labels >= 0
+    totals = np.bincount(labels[valid], weights=areas[valid],
+                         minlength=len(index_map.parcels))
+
+    return pandas.Series(totals, index=index_map.parcels)
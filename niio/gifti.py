@@ -0,0 +1,227 @@
+"""
+Streaming reader for GIFTI files.
+
+nibabel parses and decodes every DataArray of a GIFTI file before returning
+any of them.  iter_darrays instead walks the XML incrementally, decodes only
+the requested DataArrays, yields them one at a time, and stops reading the
+file once the last requested array has been decoded.
+"""
+
+import base64
+import os
+import xml.etree.ElementTree as ET
+import zlib
+
+import numpy as np
+
+
+# GIFTI data types, kept here so that reading GIFTI does not import nibabel
+DTYPES = {'NIFTI_TYPE_UINT8': np.uint8,
+          'NIFTI_TYPE_INT8': np.int8,
+          'NIFTI_TYPE_UINT16': np.uint16,
+          'NIFTI_TYPE_INT16': np.int16,
+          'NIFTI_TYPE_UINT32': np.uint32,
+          'NIFTI_TYPE_INT32': np.int32,
+          'NIFTI_TYPE_UINT64': np.uint64,
+          'NIFTI_TYPE_INT64': np.int64,
+          'NIFTI_TYPE_FLOAT32': np.float32,
+          'NIFTI_TYPE_FLOAT64': np.float64,
+          'NIFTI_TYPE_COMPLEX64': np.complex64,
+          'NIFTI_TYPE_COMPLEX128': np.complex128}
+
+ENDIAN = {'LittleEndian': '<',
+          'BigEndian': '>'}
+
+ORDER = {'RowMajorOrder': 'C',
+         'ColumnMajorOrder': 'F'}
+
+
+def count_darrays(infile):
+
+    """
+    Get the number of DataArrays in a GIFTI file, reading only its header.
+
+    Parameters:
+    - - - - -
+    infile: str
+        input gifti file
+    """
+
+    for event, elem in ET.iterparse(infile, events=('start',)):
+        if elem.tag == 'GIFTI':
+            return int(elem.get('NumberOfDataArrays'))
+
+
+def read_headers(infile, upto=None):
+
+    """
+    Get the attributes of every DataArray in a GIFTI file, without decoding
+    any data.
+
+    Parameters:
+    - - - - -
+    infile: str
+        input gifti file
+    upto: int
+        stop reading at the DataArray with this index, so that only the
+        start of the file is parsed
+
+    Returns:
+    - - - -
+    headers: list of dict
+        attributes of each DataArray element, in file order
+    """
+
+    headers = []
+    with open(infile, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start' and elem.tag == 'DataArray':
+                headers.append(dict(elem.attrib))
+                if upto is not None and len(headers) > upto:
+                    break
+            elif event == 'end' and elem.tag == 'Data':
+                elem.clear()
+
+    return headers
+
+
+def iter_darrays(infile, datasets=None, mmap=False):
+
+    """
+    Generator of decoded GIFTI DataArrays.
+
+    Parameters:
+    - - - - -
+    infile: str
+        input gifti file
+    datasets: list of int
+        indices of the DataArrays to decode.  Negative indices count from
+        the last DataArray.  If None, all DataArrays are decoded.
+    mmap: bool
+        if True, return read-only memory maps of DataArrays stored in
+        external binary files, instead of reading them into memory
+
+    Returns:
+    - - - -
+    (i, array): tuple
+        position of the DataArray in datasets (or its index in the file if
+        datasets is None), and its decoded data.  Tuples are yielded in
+        file order, not in the order of datasets.
+    """
+
+    wanted = None
+    index = -1
+
+    context = ET.iterparse(infile, events=('start', 'end'))
+
+    for event, elem in context:
+
+        if event == 'start':
+
+            if elem.tag == 'GIFTI' and datasets is not None:
+                n = int(elem.get('NumberOfDataArrays'))
+                wanted = {}
+                for i, j in enumerate(datasets):
+                    j = int(j)
+                    if not -n <= j < n:
+                        raise IndexError(
+                            '{} has no DataArray {}.'.format(infile, j))
+                    wanted.setdefault(j % n, []).append(i)
+
+            elif elem.tag == 'DataArray':
+                index += 1
+                darray = dict(elem.attrib)
+
+        elif elem.tag == 'Data':
+
+            if wanted is None:
+                yield index, decode(elem.text, darray, infile, mmap)
+            elif index in wanted:
+                array = decode(elem.text, darray, infile, mmap)
+                for i in wanted.pop(index):
+                    yield i, array
+
+            # release the payload of every DataArray once it is handled
+            elem.clear()
+
+        elif elem.tag == 'DataArray':
+
+            elem.clear()
+            if wanted is not None and not wanted:
+                break
+
+
+def decode(text, attrib, infile, mmap=False):
+
+    """
+    Decode the contents of a GIFTI Data element.
+
+    Parameters:
+    - - - - -
+    text: str
+        character data of the Data element
+    attrib: dict
+        attributes of the parent DataArray element
+    infile: str
+        gifti file containing the element, used to locate external files
+    mmap: bool
+        if True, memory-map data stored in an external file
+
+    Returns:
+    - - - -
+    array: array
+        decoded data, with the shape of the DataArray
+    """
+
+    dtype = dtype_of(attrib)
+
+    ndim = int(attrib.get('Dimensionality', 1))
+    shape = tuple(int(attrib['Dim{}'.format(d)]) for d in range(ndim))
+    order = ORDER[attrib.get('ArrayIndexingOrder', 'RowMajorOrder')]
+
+    encoding = attrib['Encoding']
+
+    if encoding == 'ASCII':
+        array = np.array(text.split(), dtype=dtype)
+
+    elif encoding in ['Base64Binary', 'GZipBase64Binary']:
+        buff = base64.b64decode(text)
+        if encoding == 'GZipBase64Binary':
+            buff = zlib.decompress(buff)
+        # bytearray, so that the returned array is writeable
+        array = np.frombuffer(bytearray(buff), dtype=dtype)
+
+    elif encoding == 'ExternalFileBinary':
+        external = external_file(infile, attrib)
+        offset = int(attrib.get('ExternalFileOffset', 0))
+        if mmap:
+            return np.memmap(external, dtype=dtype, mode='r', offset=offset,
+                             shape=shape, order=order)
+        array = np.fromfile(external, dtype=dtype,
+                            count=int(np.prod(shape)), offset=offset)
+
+    else:
+        raise IOError('Unknown GIFTI encoding {}.'.format(encoding))
+
+    return array.reshape(shape, order=order)
+
+
+def external_file(infile, attrib):
+
+    """
+    Path of the external data file of a DataArray, which GIFTI names
+    relative to the directory of the GIFTI file.
+    """
+
+    return os.path.join(os.path.dirname(infile), attrib['ExternalFileName'])
+
+
+def dtype_of(attrib):
+
+    """
+    Data type, including byte order, of a DataArray.
+    """
+
+    dtype = np.dtype(DTYPES[attrib['DataType']])
+
+    return dtype.newbyteorder(ENDIAN.get(attrib.get('Endian'), '='))
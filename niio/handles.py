@@ -0,0 +1,224 @@
+"""
+Pool of open, read-only hdf5 file handles.
+
+Opening an hdf5 file parses its superblock and metadata, which dominates the
+cost of reading small datasets.  loaded.loadMat and loaded.loadH5 acquire
+their handles from the module-level pool, so that repeated reads of the same
+file reuse one open handle.  Handles are keyed on path and modification
+time, so a file that is rewritten on disk is re-opened on its next access.
+
+HDF5 refuses to truncate a file that is open in the same process, so code
+that rewrites a file with h5py should call discard() on its path first.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+
+class HandlePool(object):
+
+    """
+    Bounded, least-recently-used pool of read-only h5py File objects.
+
+    Handles currently in use are never closed by eviction.  If every handle
+    is in use, the pool temporarily grows past its maximum size, and shrinks
+    again as handles are released.
+    """
+
+    def __init__(self, maxsize=32):
+
+        """
+        Instantiate HandlePool object.
+
+        Parameters:
+        - - - - -
+        maxsize: int
+            maximum number of idle handles kept open
+        """
+
+        self.maxsize = maxsize
+
+        self._entries = OrderedDict()
+        self._owners = {}
+        self._retired = {}
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, infile):
+
+        """
+        Get an open handle for a file, opening it if necessary.  Every
+        acquired handle must be given back with release().
+
+        Parameters:
+        - - - - -
+        infile: str
+            path to hdf5 file
+
+        Returns:
+        - - - -
+        h5: h5py File
+            open, read-only file object
+
+        Raises OSError if the file cannot be opened by h5py.
+        """
+
+        import h5py
+
+        path = os.path.realpath(infile)
+        mtime = os.stat(path).st_mtime_ns
+
+        with self._lock:
+
+            entry = self._entries.get(path)
+            if entry is not None and entry['mtime'] != mtime:
+                # file has changed on disk since it was opened
+                self._retire(path)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                h5 = h5py.File(path, mode='r')
+                entry = {'mtime': mtime, 'handle': h5, 'refs': 0}
+                self._entries[path] = entry
+                self._owners[id(h5)] = path
+            else:
+                self.hits += 1
+                self._entries.move_to_end(path)
+
+            entry['refs'] += 1
+            self._evict()
+
+            return entry['handle']
+
+    def release(self, h5):
+
+        """
+        Give back a handle obtained from acquire().
+
+        Parameters:
+        - - - - -
+        h5: h5py File
+            handle returned by acquire()
+        """
+
+        with self._lock:
+
+            key = id(h5)
+            if key in self._retired:
+                entry = self._retired[key]
+                entry['refs'] -= 1
+                if not entry['refs']:
+                    del self._retired[key]
+                    entry['handle'].close()
+                return
+
+            path = self._owners[key]
+            self._entries[path]['refs'] -= 1
+            self._evict()
+
+    def flush(self):
+
+        """
+        Close all idle handles.  Handles still in use are closed as soon as
+        they are released.
+        """
+
+        with self._lock:
+            for path in list(self._entries.keys()):
+                self._retire(path)
+
+    def discard(self, infile):
+
+        """
+        Remove a single file from the pool, closing its handle once idle.
+
+        Parameters:
+        - - - - -
+        infile: str
+            path to hdf5 file
+        """
+
+        path = os.path.realpath(infile)
+
+        with self._lock:
+            if path in self._entries:
+                self._retire(path)
+
+    def stats(self):
+
+        """
+        Get pool usage statistics.
+
+        Returns:
+        - - - -
+        stats: dict
+            hits, misses, evictions, number of open handles and maximum size
+        """
+
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._entries),
+                    'maxsize': self.maxsize}
+
+    def _retire(self, path):
+
+        """
+        Remove an entry from the pool, closing its handle once idle.
+        """
+
+        entry = self._entries.pop(path)
+        key = id(entry['handle'])
+        del self._owners[key]
+
+        if entry['refs']:
+            self._retired[key] = entry
+        else:
+            entry['handle'].close()
+
+    def _evict(self):
+
+        """
+        Close least-recently-used idle handles until within maximum size.
+        """
+
+        idle = [p for p, e in self._entries.items() if not e['refs']]
+        while len(self._entries) > self.maxsize and idle:
+            self._retire(idle.pop(0))
+            self.evictions += 1
+
+
+pool = HandlePool()
+
+
+def flush():
+
+    """
+    Close all idle handles in the shared pool.
+    """
+
+    pool.flush()
+
+
+def discard(infile):
+
+    """
+    Remove a single file from the shared pool.
+    """
+
+    pool.discard(infile)
+
+
+def stats():
+
+    """
+    Get usage statistics of the shared pool.
+    """
+
+    return pool.stats()
@@ -6,30 +6,252 @@ Created on Thu Mar  2 10:43:58 2017
 """
 
 import numpy as np
-import nibabel as nb
-import scipy.io as sio
 
+from collections.abc import Mapping
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                as_completed)
 import os
-import h5py
 import pickle
+import xml.etree.ElementTree as ET
 
+from niio import caching, gifti, handles
 
-def load(datafile, **kwargs):
+
+def load(datafile, cache=None, **kwargs):
 
     """
     Wrapper method to load common neuroimaging data.
+
+    Parameters:
+    - - - - -
+        datafile : input file name
+        cache : caching.ResultCache object, in front of which the file is
+                loaded.  If True, uses the shared caching.get_default()
+                cache.  Cached results are read-only.  Calls passing an
+                out buffer are not cached.
+        kwargs : passed to the loader for the file type
+
+    The loader is chosen by the longest registered suffix of the file name
+    (e.g. '.nii.gz' before '.gz'), or, for unknown suffixes, by sniffing the
+    first bytes of the file.  See register.
     """
 
     assert os.path.exists(datafile)
 
-    filename, file_extension = os.path.splitext(datafile)
+    loader = find_reader(datafile)
+
+    if cache:
+        if cache is True:
+            cache = caching.get_default()
+        return cache.fetch(datafile, loader, **kwargs)
+
+    return loader(datafile, **kwargs)
+
+
+def register(suffix, reader):
+
+    """
+    Register a loader for files ending in a given suffix.
+
+    Packages can also provide loaders through the 'niio.readers' entry
+    point group, where the entry point name is the suffix:
+
+        [options.entry_points]
+        niio.readers =
+            .mgh = mypackage.io:load_mgh
+
+    Parameters:
+    - - - - -
+        suffix : file name suffix, including the leading period.  Compound
+                    suffixes such as '.dtseries.nii' are matched before
+                    their shorter endings.
+        reader : function called as reader(datafile, **kwargs)
+    """
+
+    READERS[suffix.lower()] = reader
+
+
+def find_reader(datafile):
+
+    """
+    Get the loader for a file.
+
+    Parameters:
+    - - - - -
+        datafile : input file name
+    """
+
+    if not _plugins_loaded:
+        _load_plugins()
+
+    parts = os.path.basename(datafile).lower().split('.')
+
+    # longest suffix first
+    for i in range(1, len(parts)):
+        suffix = '.' + '.'.join(parts[i:])
+        if suffix in READERS:
+            return READERS[suffix]
+
+    reader = sniff(datafile)
+    if reader is None:
+        raise IOError('Cannot determine file type of {}.'.format(datafile))
+
+    return reader
+
+
+def sniff(datafile):
+
+    """
+    Guess the loader for a file from its first bytes.  Returns None if the
+    file type is not recognized.
+
+    Parameters:
+    - - - - -
+        datafile : input file name
+    """
+
+    with open(datafile, 'rb') as f:
+        head = f.read(1024)
+
+    if head.startswith(b'\x93NUMPY') or head.startswith(b'PK\x03\x04'):
+        # .npy, or zip archive of .npy files
+        return loadNpy
+    if head.startswith(b'MATLAB'):
+        # v7.3 files are hdf5 files behind a 512-byte MATLAB header
+        return loadMat
+    if head.startswith(HDF5_SIGNATURE):
+        return loadH5
+    if head.startswith(b'<?xml') and b'<GIFTI' in head:
+        return loadGii
+    if head.startswith(b'\x1f\x8b'):
+        # gzip, i.e. .nii.gz
+        return loadNifti
+    if head[344:348] in [b'n+1\x00', b'ni1\x00'] or head[4:8] == b'n+2\x00':
+        return loadNifti
+    if len(head) > 1 and head[0] == 0x80 and 2 <= head[1] <= 5:
+        # pickle protocol 2 and above
+        return loadPick
+
+    return None
+
+
+def _load_plugins():
+
+    """
+    Register loaders provided by installed packages through the
+    'niio.readers' entry point group.  Built-in and explicitly registered
+    loaders take precedence.
+    """
+
+    global _plugins_loaded
+
+    _plugins_loaded = True
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group='niio.readers')
+    else:
+        eps = eps.get('niio.readers', [])
+
+    for ep in eps:
+        suffix = ep.name.lower()
+        if suffix not in READERS:
+            try:
+                READERS[suffix] = ep.load()
+            except Exception:
+                # a broken plugin should not break loading other formats
+                pass
+
+
+def load_many(paths, workers=None, executor='thread', stream=False,
+              stack=False, stack_dtype=None, **kwargs):
+
+    """
+    Load many files in parallel.
+
+    Parameters:
+    - - - - -
+        paths : list of input file names
+        workers : number of threads or processes.  Defaults to the
+                    concurrent.futures default for the executor.
+        executor : 'thread' or 'process'.  Threads suit loaders that release
+                    the GIL (h5py, zlib); processes suit GIFTI decoding, at
+                    the cost of pickling each result back to the caller.
+        stream : if True, return a generator of (index, data) tuples,
+                    yielded in order of completion rather than input order
+        stack : if True, return a single array of shape
+                    (len(paths), ...) -- i.e. (subjects, vertices, arrays)
+                    for GIFTI files -- filled as files finish loading.  All
+                    files must have the same shape.
+        stack_dtype : data type of the stacked array.  Defaults to the
+                    np.result_type of all loaded files, whatever order they
+                    finish in.
+        kwargs : passed to load for every file
+
+    Returns:
+    - - - -
+        data : list of loaded data, in the same order as paths, or stacked
+                array, or generator if stream is True
+    """
+
+    paths = list(paths)
+
+    if stream:
+        return _iter_many(paths, workers, executor, kwargs)
+
+    if stack:
+        if not paths:
+            return np.empty((0,), dtype=stack_dtype or np.float64)
+
+        data = None
+        for i, result in _iter_many(paths, workers, executor, kwargs):
+            if data is None:
+                data = np.empty((len(paths),) + result.shape,
+                                dtype=stack_dtype or result.dtype)
+            elif result.shape != data.shape[1:]:
+                raise ValueError('{} has shape {}, expected {}.'.format(
+                    paths[i], result.shape, data.shape[1:]))
+            elif stack_dtype is None and \
+                    np.result_type(data.dtype, result.dtype) != data.dtype:
+                # widen to hold a later file, rather than casting it
+                data = data.astype(np.result_type(data.dtype, result.dtype))
+            data[i] = result
+        return data
+
+    data = [None] * len(paths)
+    for i, result in _iter_many(paths, workers, executor, kwargs):
+        data[i] = result
+
+    return data
 
-    function_map = {'.mat': loadMat,
-                    '.gii': loadGii,
-                    '.h5': loadH5,
-                    '.p': loadPick}
 
-    return function_map[file_extension](datafile, **kwargs)
+def _iter_many(paths, workers, executor, kwargs):
+
+    """
+    Generator of (index, data) tuples for load_many, in completion order.
+    """
+
+    executors = {'thread': ThreadPoolExecutor,
+                 'process': ProcessPoolExecutor}
+
+    with executors[executor](max_workers=workers) as pool:
+
+        futures = {pool.submit(load, p, **kwargs): i
+                   for i, p in enumerate(paths)}
+
+        try:
+            for future in as_completed(futures):
+                i = futures.pop(future)
+                yield i, future.result()
+        finally:
+            # caller stopped early, or a file failed to load
+            for future in futures:
+                future.cancel()
 
 
 def loadMat(infile, datasets=None):
@@ -43,48 +265,55 @@ def loadMat(infile, datasets=None):
                     returns first non-private key data array.
     """
 
+    import scipy.io as sio
+
     try:
-        matData = h5py.File(infile, mode='r')
+        matData = handles.pool.acquire(infile)
     except OSError:
         try:
             matData = sio.loadmat(infile)
         except FileNotFoundError:
             err = 'Cannot read with h5py or scipy.io.'
             raise Warning(err)
+        is_h5 = False
+    else:
+        is_h5 = True
 
-    # if key name is known
-    if datasets:
-        try:
-            mat = np.asarray(matData[datasets]).squeeze()
-        except KeyError:
-            pass
+    try:
+        # if key name is known
+        if datasets:
+            try:
+                mat = np.asarray(matData[datasets]).squeeze()
+            except KeyError:
+                pass
+            else:
+                if is_h5:
+                    mat = mat.T
+
+        # otherwise, parse through keys, and select first non-private key name
+        # and data array
         else:
-            if type(matData) == h5py._hl.files.File:
-                mat = mat.T
 
-    # otherwise, parse through keys, and select first non-private key name
-    # and data array
-    else:
-
-        # remove private keys
-        keys = [k for k in matData.keys() if k.startswith('_')]
-        matData = {k: matData[k] for k in matData.keys() if k not in keys}
+            # remove private keys
+            keys = [k for k in matData.keys() if not k.startswith('_')]
 
-        # get first non-private key
-        key = list(matData.keys())[0]
-        mat = np.asarray(matData[key]).squeeze()
+            # get first non-private key
+            key = keys[0]
+            mat = np.asarray(matData[key]).squeeze()
 
-        if type(matData) == h5py._hl.files.File:
+            if is_h5:
                 mat = mat.T
 
-    # if h5py, close object
-    if type(matData) == h5py._hl.files.File:
-        matData.close()
+    # if h5py, return handle to pool
+    finally:
+        if is_h5:
+            handles.pool.release(matData)
 
     return mat
 
 
-def loadGii(infile, datasets=[], group=None):
+def loadGii(infile, datasets=[], group=None, dtype=None, order='C', out=None,
+            mmap=False):
     """
     Method to load Gifti files.
 
@@ -93,34 +322,180 @@ def loadGii(infile, datasets=[], group=None):
         infile : input gifti file
         darrayID : if array is .gii, often comes with multiple arrays
                     you can choose to specify which one
+        dtype : data type of the returned array.  Defaults to the data type
+                    of the stored arrays.
+        order : memory layout of the returned array, 'C' or 'F'
+        out : pre-allocated array into which data is written, with shape
+                    (vertices, arrays), or (vertices,) for a single array.
+                    Reusing out across files avoids allocating a new array
+                    per file.  If given, dtype and order are ignored, and
+                    out is returned.
+        mmap : if True, and the selected arrays are stored in an external
+                    binary file, return a read-only np.memmap view of the
+                    file instead of reading it.  Multiple arrays are returned
+                    as a single (vertices, arrays) view when they are stored
+                    back to back, as written by write.save.  Otherwise, or
+                    if dtype or out are given, data is read into memory.
     """
 
+    if isinstance(datasets, int):
+        datasets = [datasets]
+    elif isinstance(datasets, np.ndarray):
+        datasets = list(datasets)
+
+    if infile.endswith('.gii') or sniff(infile) is loadGii:
+        if mmap and dtype is None and out is None:
+            darray = _loadGiiMmap(infile, datasets)
+            if darray is not None:
+                return darray
+        return _loadGiiStream(infile, datasets, dtype, order, out)
+
+    import nibabel as nb
+
     try:
         gii = nb.load(infile)
     except IOError:
         raise Warning('{} cannot be read.'.format(infile))
 
-    if isinstance(datasets, int):
-        datasets = [datasets]
-    elif isinstance(datasets, np.ndarray):
-        datasets = list(datasets)
-    elif datasets == []:
-        datasets = list(np.arange(len(gii.darrays)))
-
-    if isinstance(gii, nb.gifti.GiftiImage):
-        darray = []
-        for j in datasets:
-            darray.append(np.asarray(gii.darrays[j].data).squeeze())
-        darray = np.column_stack(darray).squeeze()
-    elif isinstance(gii, nb.nifti2.Nifti2Image):
-        darray = np.asarray(gii.get_data()).squeeze()
+    if isinstance(gii, nb.nifti2.Nifti2Image):
+        darray = np.asanyarray(gii.dataobj).squeeze()
+
+        if out is not None:
+            np.copyto(out, darray)
+        elif dtype is not None:
+            darray = darray.astype(dtype, order=order)
     else:
         raise IOError('Cannot access array data.')
 
+    if out is not None:
+        return out
+
     return darray
 
 
-def loadH5(infile, datasets=None, group=None):
+def _loadGiiStream(infile, datasets, dtype, order, out):
+
+    """
+    Read selected DataArrays of a GIFTI file with the streaming parser,
+    writing each one into its column of the output as it is decoded.
+    Only a single decoded DataArray is held in memory at a time.
+    """
+
+    # the output type must hold every selected array.  When all arrays are
+    # read, it is widened as arrays are decoded, since the file is parsed in
+    # full anyway.  Otherwise, DataTypes are read from the headers before
+    # allocating, parsing only up to the last selected array.
+    widen = dtype is None and out is None and datasets == []
+
+    try:
+        if datasets == []:
+            datasets = list(range(gifti.count_darrays(infile)))
+        elif dtype is None and out is None:
+            headers = gifti.read_headers(infile, upto=max(datasets))
+            dtype = np.result_type(*[gifti.dtype_of(headers[j]).newbyteorder(
+                '=') for j in datasets])
+    except (IOError, ET.ParseError):
+        raise Warning('{} cannot be read.'.format(infile))
+
+    darray = None
+    for i, a in gifti.iter_darrays(infile, datasets):
+
+        # squeezing only creates a view of the decoded array
+        a = a.squeeze()
+
+        # allocate output once the size of the first array is known
+        if darray is None:
+            rows = a.shape[0]
+            width = a.size // rows
+            shape = (rows, width * len(datasets))
+
+            if out is None:
+                if dtype is None:
+                    dtype = a.dtype.newbyteorder('=')
+                darray = np.empty(shape, dtype=dtype, order=order)
+            else:
+                darray = _column_view(out, shape)
+
+        elif widen and np.result_type(darray.dtype, a.dtype) != darray.dtype:
+            darray = darray.astype(np.result_type(darray.dtype, a.dtype),
+                                   order=order)
+
+        if a.size != rows * width:
+            raise ValueError('DataArray {} has shape {}, expected {}.'.format(
+                datasets[i], a.shape, (rows, width)))
+
+        darray[:, i*width:(i+1)*width] = a.reshape(rows, width)
+
+    if out is not None:
+        return out
+
+    return darray.squeeze()
+
+
+def _loadGiiMmap(infile, datasets):
+
+    """
+    Memory-map selected DataArrays of a GIFTI file stored in an external
+    binary file.  Returns None if they cannot be mapped as a single view.
+    """
+
+    headers = gifti.read_headers(infile)
+    if datasets == []:
+        datasets = range(len(headers))
+    selected = [headers[j] for j in datasets]
+
+    first = selected[0]
+    shape = tuple(int(first['Dim{}'.format(d)])
+                  for d in range(int(first.get('Dimensionality', 1))))
+    dtype = gifti.dtype_of(first)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    offset = int(first.get('ExternalFileOffset', 0))
+
+    if len(selected) == 1:
+        if first['Encoding'] != 'ExternalFileBinary':
+            return None
+        order = gifti.ORDER[first.get('ArrayIndexingOrder', 'RowMajorOrder')]
+        return np.memmap(gifti.external_file(infile, first), dtype=dtype,
+                         mode='r', offset=offset, shape=shape,
+                         order=order).squeeze()
+
+    # several arrays map to one (arrays, vertices) block only if they are
+    # vectors of one type stored back to back in the same file
+    keys = ['Encoding', 'ExternalFileName', 'DataType', 'Endian', 'Dim0']
+    for i, h in enumerate(selected):
+        if (first['Encoding'] != 'ExternalFileBinary' or
+                int(h.get('Dimensionality', 1)) != 1 or
+                any(h.get(k) != first.get(k) for k in keys) or
+                int(h.get('ExternalFileOffset', 0)) != offset + i * nbytes):
+            return None
+
+    block = np.memmap(gifti.external_file(infile, first), dtype=dtype,
+                      mode='r', offset=offset, shape=(len(selected),) + shape)
+
+    return block.T
+
+
+def _column_view(out, shape):
+
+    """
+    View of a user-supplied output array as a (vertices, arrays) matrix.
+    """
+
+    if out.size != np.prod(shape):
+        raise ValueError('out has shape {}, expected {}.'.format(
+            out.shape, shape))
+
+    view = out.view()
+    try:
+        view.shape = shape
+    except AttributeError:
+        raise ValueError('out cannot be reshaped to {} without copying.'.format(
+            shape))
+
+    return view
+
+
+def loadH5(infile, datasets=None, group=None, lazy=False):
     """
     Method to load hdf5 files.
 
@@ -131,41 +506,147 @@ def loadH5(infile, datasets=None, group=None):
                 dictionary of all key-value pairs in file.
         group : group in which datasets are contained.  Otherwise, datasets
                 assumed to exist at top level of file structure.
+        lazy : if True, do not read any data.  Instead, return an H5Proxy
+                whose values are h5py datasets, so that slicing a value only
+                reads the requested hyperslab from disk.  The file stays open
+                until the proxy is closed.
     """
 
     assert os.path.exists(infile)
 
+    import h5py
+
     try:
-        h5 = h5py.File(infile, 'r')
+        if lazy:
+            h5 = h5py.File(infile, 'r')
+        else:
+            h5 = handles.pool.acquire(infile)
     except IOError:
         raise Warning('File cannot be loaded.')
 
+    # lazy proxies own their file, all other handles go back to the pool
+    close = h5.close if lazy else lambda: handles.pool.release(h5)
+
     # If user specifies an object group containing data
-    data = {}
     if group:
         try:
             h5Lower = h5[group]
-            h5.close()
         except KeyError:
+            close()
             raise Warning('File does not have group {}.'.format(group))
     else:
         h5Lower = h5
 
     # If User specifies specific object datasets
     if not datasets:
-        datasets = h5Lower.keys()
+        datasets = list(h5Lower.keys())
+    elif isinstance(datasets, str):
+        datasets = [datasets]
 
-    for k in datasets:
-        try:
-            data[k] = np.asarray(h5Lower[k])
-        except KeyError:
-            raise Warning('File does not have attribute {}.'.format(k))
+    missing = [k for k in datasets if k not in h5Lower]
+    if missing:
+        close()
+        raise Warning('File does not have attribute {}.'.format(missing[0]))
 
-    h5Lower.close()
+    if lazy:
+        return H5Proxy(h5, h5Lower, datasets)
+
+    data = {}
+    try:
+        for k in datasets:
+            data[k] = np.asarray(h5Lower[k])
+    finally:
+        close()
 
     return data
 
 
+class H5Proxy(Mapping):
+
+    """
+    Read-only, dict-like view of the datasets in an open hdf5 file.
+
+    Values are h5py datasets rather than numpy arrays, so indexing a value,
+    i.e. proxy['data'][100:200, :], reads only the requested rows from disk.
+    Use np.asarray(proxy['data']) to read a whole dataset.
+
+    The underlying file is closed by calling close(), or on leaving a
+    with-block:
+
+    >>> with loadH5('connectivity.h5', lazy=True) as h5:
+    ...     rows = h5['data'][parcel_indices, :]
+
+    """
+
+    def __init__(self, h5, node, datasets):
+
+        """
+        Instantiate H5Proxy object.
+
+        Parameters:
+        - - - - -
+        h5: h5py File
+            open file object, owned by the proxy
+        node: h5py File or Group
+            object containing the datasets
+        datasets: list
+            names of datasets exposed by the proxy
+        """
+
+        self._file = h5
+        self._node = node
+        self._keys = list(datasets)
+        self.filename = h5.filename
+
+    def __getitem__(self, key):
+
+        if key not in self._keys:
+            raise KeyError(key)
+        if self.closed:
+            raise ValueError('Cannot access {}: file is closed.'.format(key))
+
+        return self._node[key]
+
+    def __iter__(self):
+
+        return iter(self._keys)
+
+    def __len__(self):
+
+        return len(self._keys)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def __repr__(self):
+
+        state = 'closed' if self.closed else 'open'
+        return '<H5Proxy {} {} {}>'.format(state, self.filename, self._keys)
+
+    @property
+    def closed(self):
+
+        """
+        True if the underlying file has been closed.
+        """
+
+        return not self._file.id.valid
+
+    def close(self):
+
+        """
+        Close the underlying hdf5 file.
+        """
+
+        if not self.closed:
+            self._file.close()
+
+
 def loadPick(infile, datasets=None, group=None):
     """
     Method to load pickle file.  Not part of a specific class.
@@ -185,7 +666,154 @@ def loadPick(infile, datasets=None, group=None):
 
     return pick
 
-def loadSurf(inFile, gifti=True):
+def loadNifti(infile, dtype=None):
+
+    """
+    Method to load NIfTI-1, NIfTI-2 and CIFTI-2 files, including gzipped
+    files.
+
+    Parameters:
+    - - - - -
+        infile : input file name
+        dtype : data type of the returned array.  Defaults to the data type
+                    of the (scaled) stored data.
+    """
+
+    import nibabel as nb
+
+    try:
+        img = nb.load(infile)
+    except nb.filebasedimages.ImageFileError:
+        # nibabel chooses the image type by extension, which sniffed files
+        # may not have
+        data = _loadNiftiStream(infile)
+    except IOError:
+        raise Warning('{} cannot be read.'.format(infile))
+    else:
+        data = np.asanyarray(img.dataobj)
+
+    data = data.squeeze()
+    if dtype is not None:
+        data = data.astype(dtype)
+
+    return data
+
+
+def _loadNiftiStream(infile):
+
+    """
+    Read the data of a single-file NIfTI image, choosing the image type
+    from its header rather than its extension.
+    """
+
+    import gzip
+    import nibabel as nb
+
+    with open(infile, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+
+    opener = gzip.open if gzipped else open
+    with opener(infile, 'rb') as f:
+        head = f.read(348)
+        f.seek(0)
+
+        klass = nb.Nifti2Image if head[4:8] == b'n+2\x00' else nb.Nifti1Image
+        img = klass.from_stream(f)
+
+        return np.asanyarray(img.dataobj)
+
+
+def loadNpy(infile, datasets=None, mmap_mode=None):
+
+    """
+    Method to load numpy .npy and .npz files.
+
+    Parameters:
+    - - - - -
+        infile : input file name
+        datasets : for .npz files, names of arrays to load.  Otherwise,
+                    returns dictionary of all arrays in file.
+        mmap_mode : None, 'r', 'r+' or 'c'.  If given, arrays are returned
+                    as np.memmap views of the file, which load in constant
+                    time and share memory between processes through the
+                    page cache.  For .npz files, only 'r' and 'c' are
+                    allowed, since writing to an archive member would not
+                    update its checksum.  Arrays in compressed .npz files
+                    cannot be memory-mapped, and are read into memory.
+    """
+
+    assert os.path.exists(infile)
+
+    with open(infile, 'rb') as f:
+        is_npz = f.read(4) == b'PK\x03\x04'
+
+    if not is_npz:
+        return np.load(infile, mmap_mode=mmap_mode)
+
+    if mmap_mode not in [None, 'r', 'c']:
+        raise ValueError("{} is an .npz archive, which can only be "
+                         "memory-mapped with mode 'r' or 'c', not "
+                         "{!r}.".format(infile, mmap_mode))
+
+    if isinstance(datasets, str):
+        datasets = [datasets]
+
+    data = {}
+    with np.load(infile) as npz:
+
+        names = datasets or npz.files
+        missing = [k for k in names if k not in npz.files]
+        if missing:
+            raise Warning('File does not have attribute {}.'.format(
+                missing[0]))
+
+        for k in names:
+            array = None
+            if mmap_mode:
+                info = npz.zip.getinfo(k + '.npy')
+                array = _npz_memmap(infile, info, mmap_mode)
+            data[k] = npz[k] if array is None else array
+
+    return data
+
+
+def _npz_memmap(infile, info, mmap_mode):
+
+    """
+    Memory-map an array stored uncompressed in an .npz file.  Returns None
+    if the array is compressed, or holds Python objects.
+    """
+
+    import zipfile
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(infile, 'rb') as f:
+
+        # the local file header has a fixed 30 bytes, then the file name and
+        # an extra field whose lengths are stored at bytes 26-29
+        f.seek(info.header_offset)
+        local = f.read(30)
+        skip = int.from_bytes(local[26:28], 'little') + \
+            int.from_bytes(local[28:30], 'little')
+        f.seek(skip, 1)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject:
+        return None
+
+    return np.memmap(infile, dtype=dtype, mode=mmap_mode, offset=offset,
+                     shape=shape, order='F' if fortran else 'C')
+
+
+def loadSurf(inFile, gifti=True, cache=True):
 
     """
     Method to load gifti surface file.
@@ -194,6 +822,13 @@ def loadSurf(inFile, gifti=True):
     - - - - -
     inFile: str
         path to surface file
+    gifti: bool
+        file is a GIFTI file, rather than a FreeSurfer surface
+    cache: bool
+        read the mesh from a binary cache next to inFile, if it is up to
+        date, and write the cache otherwise.  Cached meshes keep the data
+        types of the parsed file, and are memory-mapped copy-on-write, so
+        load in constant time.
     
     Returns:
     - - - -
@@ -203,6 +838,13 @@ def loadSurf(inFile, gifti=True):
         array of mesh triangles
     """
 
+    if cache:
+        mesh = _readSurfCache(inFile, gifti)
+        if mesh is not None:
+            return mesh
+
+    import nibabel as nb
+
     if gifti:
         surf = nb.load(inFile)
         vertices = surf.darrays[0].data
@@ -212,4 +854,114 @@ def loadSurf(inFile, gifti=True):
         vertices = surf[0]
         faces = surf[1]
 
-    return [vertices, faces]
\ No newline at end of file
+    if cache:
+        _writeSurfCache(inFile, gifti, vertices, faces)
+
+    return [vertices, faces]
+
+
+def _surfCachePath(inFile, gifti):
+
+    """
+    Cache file of a surface file.  GIFTI and FreeSurfer parses of the same
+    file are cached separately.
+    """
+
+    return inFile + ('.mesh.npz' if gifti else '.fs.mesh.npz')
+
+
+def _readSurfCache(inFile, gifti):
+
+    """
+    Memory-map the cached mesh of a surface file.  Returns None if there is
+    no cache, or the surface file has changed since it was written.
+    """
+
+    mesh = _readSidecar(_surfCachePath(inFile, gifti), inFile,
+                        ['vertices', 'faces'])
+    if mesh is None:
+        return None
+
+    return [mesh['vertices'], mesh['faces']]
+
+
+def _writeSurfCache(inFile, gifti, vertices, faces):
+
+    """
+    Write the mesh of a surface file to an uncompressed .npz file next to
+    it, in the data types it was parsed as.
+    """
+
+    _writeSidecar(_surfCachePath(inFile, gifti), inFile,
+                  vertices=np.asarray(vertices), faces=np.asarray(faces))
+
+
+def _sourceStamp(inFile):
+
+    """
+    Modification time and size identifying the current version of a file.
+    """
+
+    st = os.stat(inFile)
+
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def _readSidecar(path, inFile, names):
+
+    """
+    Memory-map, copy-on-write, the arrays of an .npz file caching data
+    derived from inFile.  Returns None if the file is missing or lacks any
+    of names, or if inFile has changed since the file was written.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        data = loadNpy(path, mmap_mode='c')
+    except (OSError, ValueError, Warning):
+        return None
+
+    if not isinstance(data, dict) or \
+            not set(names) | {'source'} <= set(data) or \
+            not np.array_equal(data['source'], _sourceStamp(inFile)):
+        return None
+
+    return data
+
+
+def _writeSidecar(path, inFile, **arrays):
+
+    """
+    Write arrays derived from inFile to an uncompressed .npz file, stamped
+    with the modification time and size of inFile.  The file is replaced
+    atomically, and failures, e.g. in read-only directories, are ignored.
+    """
+
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+
+    try:
+        with open(temp, 'wb') as f:
+            np.savez(f, source=_sourceStamp(inFile), **arrays)
+        os.replace(temp, path)
+    except OSError:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+READERS = {'.gii': loadGii,
+           '.h5': loadH5,
+           '.hdf5': loadH5,
+           '.mat': loadMat,
+           '.nii': loadNifti,
+           '.nii.gz': loadNifti,
+           '.npy': loadNpy,
+           '.npz': loadNpy,
+           '.p': loadPick,
+           '.pkl': loadPick,
+           '.pickle': loadPick}
+
+_plugins_loaded = False
@@ -0,0 +1,261 @@
+"""
+Sparse smoothing of surface data.
+
+Each smoothing kernel is built once per mesh as a row-normalized sparse
+(n_vertices, n_vertices) matrix, and applied to a whole (vertices,
+timepoints) block by sparse matrix products.  Three kernels are available:
+
+- 'neighbor': each step replaces a vertex by the mean of itself and its
+  neighbors.
+- 'heat': each step replaces a vertex by a Gaussian-weighted mean over its
+  1-ring.  Repeated steps approximate heat kernel smoothing.
+- 'gaussian': a single Gaussian-weighted mean over the k-ring reaching
+  `truncate` standard deviations.  This is closer to a true Gaussian, but
+  the matrix grows with the square of the FWHM in edges, so 'heat' is
+  cheaper for wide kernels.
+
+Variances add up over steps, so the iterative kernels reach a given FWHM
+by taking as many steps as the kernel variance divided by the variance of
+one step, measured on the mesh.
+
+>>> surf = surface.Surface.load('L.midthickness.surf.gii')
+>>> smoothed = smoothing.smooth(data, surf, fwhm=6, workers=8)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+# standard deviation of a Gaussian with a FWHM of 1
+FWHM_SIGMA = 1 / np.sqrt(8 * np.log(2))
+
+METHODS = ['neighbor', 'heat', 'gaussian']
+
+
+class Smoother(object):
+
+    """
+    Smoothing operator, applying a sparse matrix a number of times.
+    """
+
+    def __init__(self, matrix, iterations=1):
+
+        """
+        Instantiate Smoother object.
+
+        Parameters:
+        - - - - -
+        matrix: scipy.sparse matrix
+            (n_vertices, n_vertices) row-normalized smoothing step
+        iterations: int
+            number of times the step is applied
+        """
+
+        self.matrix = matrix.tocsr()
+        self.iterations = iterations
+
+        self._matrices = {}
+
+    def __call__(self, X, chunk=None, workers=None):
+
+        return self.apply(X, chunk=chunk, workers=workers)
+
+    def apply(self, X, chunk=None, workers=None):
+
+        """
+        Smooth data.
+
+        Parameters:
+        - - - - -
+        X: array
+            (n_vertices,) or (n_vertices, timepoints) data
+        chunk: int
+            number of columns smoothed at a time, which bounds the memory
+            of intermediate results.  Defaults to all columns, split evenly
+            between workers.
+        workers: int
+            number of threads smoothing chunks of columns in parallel
+
+        Returns:
+        - - - -
+        Y: array
+            smoothed data of the same shape as X.  Floating point data keeps
+            its type, other data is smoothed as float64.
+        """
+
+        X = np.asarray(X)
+        if X.shape[0] != self.matrix.shape[0]:
+            raise ValueError('Data has {} rows, but the mesh has {} '
+                             'vertices.'.format(X.shape[0],
+                                                self.matrix.shape[0]))
+
+        dtype = X.dtype if X.dtype.kind == 'f' else np.dtype(np.float64)
+        M = self._matrix(dtype)
+
+        Y = np.empty(X.shape, dtype=dtype)
+        X2, Y2 = X.reshape(len(X), -1), Y.reshape(len(Y), -1)
+
+        columns = X2.shape[1]
+        workers = workers or 1
+        chunk = chunk or -(-columns // workers)
+        blocks = [slice(i, i + chunk) for i in range(0, columns, chunk)]
+
+        def smooth_block(block):
+            B = X2[:, block]
+            for _ in range(self.iterations):
+                B = M @ B
+            Y2[:, block] = B
+
+        if workers > 1 and len(blocks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(smooth_block, blocks))
+        else:
+            for block in blocks:
+                smooth_block(block)
+
+        return Y
+
+    def _matrix(self, dtype):
+
+        """
+        Smoothing matrix in the data type of the data, so that products do
+        not upcast float32 data.
+        """
+
+        if dtype not in self._matrices:
+            self._matrices[dtype] = self.matrix.astype(dtype)
+
+        return self._matrices[dtype]
+
+
+def operator(surf, method='heat', fwhm=None, iterations=None, truncate=3.0):
+
+    """
+    Build a smoothing operator for a mesh.  Use Surface.smoother to build
+    each operator only once per mesh.
+
+    Parameters:
+    - - - - -
+    surf: surface.Surface
+        mesh to smooth on
+    method: str
+        'neighbor', 'heat' or 'gaussian'
+    fwhm: float
+        full width at half maximum of the kernel, in the units of the
+        vertex coordinates.  Required for 'gaussian'.
+    iterations: int
+        number of smoothing steps of 'neighbor' and 'heat', if fwhm is not
+        given
+    truncate: float
+        for 'gaussian', radius of the kernel in standard deviations
+
+    Returns:
+    - - - -
+    smoother: Smoother
+    """
+
+    if method not in METHODS:
+        raise ValueError('Method must be one of {}.'.format(METHODS))
+
+    spacing = _edge_length(surf)
+
+    if method == 'gaussian':
+        if not fwhm:
+            raise ValueError('Gaussian smoothing needs a FWHM.')
+
+        sigma = fwhm * FWHM_SIGMA
+        k = max(1, int(np.ceil(truncate * sigma / spacing)))
+        W, _ = _weights(surf, surf.kring_matrix(k), sigma)
+
+        return Smoother(W, 1)
+
+    W, variance = _weights(surf, surf._kring_step(),
+                           spacing if method == 'heat' else None)
+
+    if fwhm:
+        if not variance:
+            raise ValueError('Mesh has no edges of non-zero length.')
+        iterations = max(1, int(round((fwhm * FWHM_SIGMA)**2 / variance)))
+    elif not iterations:
+        raise ValueError('{} smoothing needs a FWHM or a number of '
+                         'iterations.'.format(method.capitalize()))
+
+    return Smoother(W, iterations)
+
+
+def smooth(X, surf, method='heat', fwhm=None, iterations=None, chunk=None,
+           workers=None):
+
+    """
+    Smooth data on a mesh.
+
+    Parameters:
+    - - - - -
+    X: array
+        (n_vertices,) or (n_vertices, timepoints) data
+    surf: surface.Surface
+        mesh to smooth on.  Its smoothing operators are cached, so that
+        smoothing many arrays on the same Surface builds each operator once.
+    method, fwhm, iterations:
+        kernel, see operator
+    chunk, workers:
+        column chunking and threads, see Smoother.apply
+    """
+
+    smoother = surf.smoother(method, fwhm=fwhm, iterations=iterations)
+
+    return smoother.apply(X, chunk=chunk, workers=workers)
+
+
+def _edge_length(surf):
+
+    """
+    Mean edge length of a mesh.
+    """
+
+    V = np.asarray(surf.vertices, dtype=np.float64)
+    e = surf.edges
+
+    return np.sqrt(((V[e[:, 0]] - V[e[:, 1]])**2).sum(1)).mean()
+
+
+def _weights(surf, pattern, sigma=None, block=2**20):
+
+    """
+    Row-normalized weights on a sparsity pattern: Gaussian weights of the
+    distance between each pair of vertices, or equal weights if sigma is
+    None.  Distances are computed over blocks of entries, to bound memory
+    for large patterns.
+
+    Also returns the variance along one axis of a step of the kernel,
+    averaged over vertices.  On a 2D surface, this is half the mean squared
+    distance the kernel moves data.
+    """
+
+    pattern = pattern.tocsr()
+    V = np.asarray(surf.vertices, dtype=np.float64)
+
+    rows = np.repeat(np.arange(pattern.shape[0]), np.diff(pattern.indptr))
+    d2 = np.empty(pattern.nnz)
+
+    for i in range(0, pattern.nnz, block):
+        r, c = rows[i:i + block], pattern.indices[i:i + block]
+        d2[i:i + block] = ((V[r] - V[c])**2).sum(1)
+
+    if sigma is None:
+        w = np.ones(pattern.nnz)
+    else:
+        w = np.exp(-d2 / (2 * sigma**2))
+
+    sums = np.bincount(rows, weights=w, minlength=pattern.shape[0])
+    sums[sums == 0] = 1
+
+    moments = np.bincount(rows, weights=w * d2, minlength=pattern.shape[0])
+    variance = (moments / sums).mean() / 2
+
+    W = sparse.csr_matrix((w / sums[rows], pattern.indices, pattern.indptr),
+                          shape=pattern.shape)
+
+    return W, variance
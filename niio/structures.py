@@ -2,6 +2,65 @@ from niio import write
 import numpy as np
 import pandas
 
+class ParcelIndex(object):
+
+    """
+    Precomputed vertex-to-parcel mapping of a parcellation.
+
+    Building the index concatenates the vertex indices of every parcel once.
+    A single ParcelIndex can be shared by any number of ParcelImage and
+    ParcelCohort objects defined on the same parcellation.
+    """
+
+    def __init__(self, index_map, rows=32492):
+
+        """
+        Instantiate ParcelIndex object.
+
+        Parameters:
+        - - - - -
+        index_map: dictionary
+            mapping of parcel names to arrays of vertex indices
+        rows: int
+            number of vertices.  If None, one more than the largest
+            vertex index.
+        """
+
+        parcels = list(index_map.keys())
+        V = [np.asarray(index_map[k]) for k in parcels]
+
+        # parcel code of each vertex index in V
+        codes = np.repeat(np.arange(len(parcels)), [len(v) for v in V])
+        V = np.concatenate(V).astype(np.int64)
+
+        if not rows:
+            rows = V.max() + 1
+
+        # vertex -> parcel code, with -1 for vertices outside any parcel
+        labels = np.full(rows, -1, dtype=np.int32)
+        labels[V] = codes
+
+        self.index_map = index_map
+        self.parcels = parcels
+        self.labels = labels
+        self.rows = rows
+
+    def segments(self):
+
+        """
+        Vertex order grouping vertices by parcel, and size of each parcel.
+        """
+
+        if not hasattr(self, '_order'):
+            valid = np.flatnonzero(self.labels >= 0)
+            codes = self.labels[valid]
+
+            self._order = valid[np.argsort(codes, kind='stable')]
+            self._sizes = np.bincount(codes, minlength=len(self.parcels))
+
+        return self._order, self._sizes
+
+
 class ParcelImage(object):
 
     """
@@ -12,22 +71,42 @@ class ParcelImage(object):
 
     """
 
-    def __init__(self, index_map, rows=32492, columns=1, hemisphere='L'):
+    def __init__(self, index_map, rows=32492, columns=1, hemisphere='L',
+                 dtype=np.float64, compact=False):
 
         """
         Instantiate ParcelImage object.
+
+        Parameters:
+        - - - - -
+        index_map: dictionary, or ParcelIndex
+            vertex indices of each parcel.  Passing a ParcelIndex shares one
+            precomputed label vector between many images.
+        dtype: data type
+            floating point type in which scalar data is stored
+        compact: bool
+            if True, store only one row of data per parcel, and build the
+            (rows, columns) vertex-level array each time it is accessed.
+            This reduces memory from rows x columns to parcels x columns,
+            i.e. by orders of magnitude for small parcellations of large
+            meshes.
         """
 
-        V = np.concatenate([index_map[k] for k in index_map.keys()])
-        V.sort()
+        if not isinstance(index_map, ParcelIndex):
+            index_map = ParcelIndex(index_map, rows)
 
-        if not rows:
-            rows = V.max() + 1
-        
-        self.index_map = index_map
-        self.rows = rows
+        self.index = index_map
+        self.index_map = index_map.index_map
+        self.parcels = index_map.parcels
+        self.labels = index_map.labels
+        self.rows = index_map.rows
         self.columns = columns
         self.hemisphere = hemisphere
+        self.dtype = dtype
+        self.compact = compact
+
+        self._table = None
+        self._data = None
     
 
     def set_data(self, X):
@@ -48,23 +127,173 @@ class ParcelImage(object):
 
         assert isinstance(X, pandas.core.frame.DataFrame)
 
-        _, p = X.shape
-        data = np.zeros((self.rows, self.columns))*np.nan
+        missing = X.index.difference(self.parcels)
+        if len(missing):
+            raise KeyError('Parcels {} not in index_map.'.format(list(missing)))
 
-        for region in X.index:
+        # one row per parcel code, plus a final row of NaN that vertices
+        # labeled -1 (outside any parcel) take
+        n = len(self.parcels)
+        table = np.zeros((n + 1, self.columns), dtype=self.dtype)*np.nan
+        table[:n] = X.reindex(self.parcels).values
 
-            ridx = self.index_map[region]
-            data[ridx, :] = X.loc[region]
+        self._table = table
+        self._data = None if self.compact else self._expand()
 
-        self.data = data
+    @property
+    def data(self):
 
-    def get_data(self):
+        """
+        (rows, columns) vertex-level data.
+        """
+
+        if self._data is not None:
+            return self._data
+
+        return self._expand()
+
+    @property
+    def values(self):
+
+        """
+        (parcels, columns) parcel-level data, in the order of self.parcels.
+        """
+
+        return self._table[:-1]
+
+    @property
+    def nbytes(self):
+
+        """
+        Number of bytes of data stored.
+        """
+
+        stored = [a for a in (self._table, self._data) if a is not None]
+
+        return self.labels.nbytes + sum(a.nbytes for a in stored)
+
+    def _expand(self, dtype=None):
+
+        """
+        Build the vertex-level array from the parcel-level data.
+        """
+
+        table = self._table
+        if dtype is not None:
+            table = table.astype(dtype)
+
+        return np.take(table, self.labels, axis=0)
+
+    def reduce(self, X, how='mean'):
+
+        """
+        Aggregate vertex-level data into parcels.
+
+        Vertices are grouped by parcel once, after which every reduction is
+        a single vectorized pass over all parcels and columns.  NaN values
+        are ignored.  Parcels without any non-NaN value are NaN, except for
+        'sum' and 'count', where they are 0.  'std' is the population
+        standard deviation (ddof=0), unlike the pandas default of ddof=1.
+
+        Parameters:
+        - - - - -
+        X: array, or Pandas DataFrame
+            (rows, columns) vertex-level data, or a single (rows,) map
+        how: string
+            'mean', 'median', 'sum', 'std', 'min', 'max' or 'count'
+
+        Returns:
+        - - - -
+        R: Pandas DataFrame
+            (parcels, columns) reduced data, indexed by parcel name
+        """
+
+        columns = X.columns if isinstance(X, pandas.DataFrame) else None
+
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[:, None]
+
+        assert X.shape[0] == self.rows
+
+        order, sizes = self.index.segments()
+
+        # data grouped into contiguous segments, one per non-empty parcel
+        G = X[order]
+        seg = np.repeat(np.arange(len(sizes)), sizes)
+        nonempty = sizes > 0
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])[nonempty]
+
+        finite = ~np.isnan(G)
+        count = np.zeros((len(sizes), X.shape[1]), dtype=np.int64)
+        if len(G):
+            count[nonempty] = np.add.reduceat(finite, starts, axis=0)
+
+        if how == 'count':
+            R = count
+
+        elif how in ['sum', 'mean', 'std']:
+            R = np.zeros(count.shape)
+            if len(G):
+                R[nonempty] = np.add.reduceat(np.where(finite, G, 0), starts,
+                                              axis=0)
+
+            if how != 'sum':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    R = R / count
+
+            if how == 'std':
+                # second pass over deviations from the parcel mean
+                dev = np.where(finite, G - R[seg], 0)
+                S = np.zeros(count.shape)
+                if len(G):
+                    S[nonempty] = np.add.reduceat(dev**2, starts, axis=0)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    R = np.sqrt(S / count)
+
+        elif how in ['min', 'max']:
+            ufunc = np.fmin if how == 'min' else np.fmax
+            R = np.zeros(count.shape)*np.nan
+            if len(G):
+                R[nonempty] = ufunc.reduceat(G, starts, axis=0)
+
+        elif how == 'median':
+            # sort values within each parcel, NaN last, for all columns
+            keys = (G, np.broadcast_to(seg[:, None], G.shape))
+            G = np.take_along_axis(G, np.lexsort(keys, axis=0), axis=0)
+
+            first = np.concatenate([[0], np.cumsum(sizes)[:-1]])[:, None]
+            lo = np.clip(first + (count - 1) // 2, 0, max(len(G) - 1, 0))
+            hi = np.clip(first + count // 2, 0, max(len(G) - 1, 0))
+
+            R = np.zeros(count.shape)*np.nan
+            if len(G):
+                R = (np.take_along_axis(G, lo, axis=0) +
+                     np.take_along_axis(G, hi, axis=0)) / 2
+            R[count == 0] = np.nan
+
+        else:
+            raise ValueError('Unknown reduction {}.'.format(how))
+
+        return pandas.DataFrame(R, index=self.parcels, columns=columns)
+
+    def get_data(self, dtype=None):
 
         """
         Get whole ParcelImage DataFrame
+
+        Parameters:
+        - - - - -
+        dtype: data type
+            type of the returned array.  Defaults to the stored type.
         """
 
-        return self.data
+        if self._data is None:
+            return self._expand(dtype)
+        elif dtype is None:
+            return self._data
+
+        return self._data.astype(dtype)
 
     def get_parcel(self, roi):
 
@@ -77,7 +306,7 @@ class ParcelImage(object):
             parcel name
         """
 
-        return self.data.loc[roi]
+        return self.values[self.parcels.index(roi)]
 
     def write(self, outname):
 
@@ -91,3 +320,122 @@ class ParcelImage(object):
         """
 
         write.save(self.data, outname, self.hemisphere)
+
+
+class ParcelCohort(object):
+
+    """
+
+    Parcel-level data of many subjects on the same parcellation.
+
+    All subjects share one ParcelIndex, and data is stored as a single
+    (subjects, rows, columns) array.
+
+    """
+
+    def __init__(self, index_map, subjects, rows=32492, columns=1,
+                 hemisphere='L', dtype=np.float64):
+
+        """
+        Instantiate ParcelCohort object.
+
+        Parameters:
+        - - - - -
+        index_map: dictionary, or ParcelIndex
+            vertex indices of each parcel
+        subjects: list
+            subject names
+        """
+
+        if not isinstance(index_map, ParcelIndex):
+            index_map = ParcelIndex(index_map, rows)
+
+        self.index = index_map
+        self.parcels = index_map.parcels
+        self.subjects = list(subjects)
+        self.rows = index_map.rows
+        self.columns = columns
+        self.hemisphere = hemisphere
+        self.dtype = dtype
+
+    def set_data(self, X):
+
+        """
+        Set scalar data of all subjects.
+
+        Parameters:
+        - - - - -
+        X: Pandas DataFrame
+            Data corresponding to individual parcels of each subject.
+
+            DataFrame index must be a MultiIndex of (subject, parcel)
+            pairs.  Missing pairs are NaN.
+        """
+
+        assert isinstance(X, pandas.core.frame.DataFrame)
+        assert isinstance(X.index, pandas.MultiIndex)
+
+        full = pandas.MultiIndex.from_product([self.subjects, self.parcels])
+
+        missing = X.index.difference(full)
+        if len(missing):
+            raise KeyError('Pairs {} not in cohort.'.format(list(missing)))
+
+        # (subjects, parcels + 1, columns), where the last parcel row is NaN
+        # and is taken by vertices outside any parcel
+        s, n = len(self.subjects), len(self.parcels)
+        table = np.zeros((s, n + 1, self.columns), dtype=self.dtype)*np.nan
+        table[:, :n] = X.reindex(full).values.reshape(s, n, -1)
+
+        self.data = np.take(table, self.index.labels, axis=1)
+
+    def get_data(self):
+
+        """
+        Get (subjects, rows, columns) data of all subjects.
+        """
+
+        return self.data
+
+    def get_subject(self, subject):
+
+        """
+        Get (rows, columns) data of a single subject.
+
+        Parameters:
+        - - - - -
+        subject: string
+            subject name
+        """
+
+        return self.data[self.subjects.index(subject)]
+
+    def write(self, outnames, workers=None):
+
+        """
+        Write each subject's data to its own GIFTI file, in parallel.
+
+        Parameters:
+        - - - - -
+        outnames: list
+            output names, one per subject
+        workers: int
+            number of threads
+
+        Returns:
+        - - - -
+        results: list
+            per-file results of write.save_many
+        """
+
+        assert len(outnames) == len(self.subjects)
+
+        jobs = ((d, o, self.hemisphere) for d, o in zip(self.data, outnames))
+        results = write.save_many(jobs, workers=workers, executor='thread')
+
+        failed = [r for r in results if r['error']]
+        if failed:
+            raise IOError('Could not write {}: {}'.format(
+                failed[0]['output'], failed[0]['error']))
+
+        return results
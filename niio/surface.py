@@ -0,0 +1,414 @@
+"""
+Triangle mesh with lazily computed, cached topology.
+
+A Surface wraps the vertices and faces returned by loaded.loadSurf.  Derived
+structures -- the edge list, vertex adjacency matrix and vertex-to-face
+incidence matrix, and the areas and normals of niio.geometry -- are built
+with vectorized numpy / scipy.sparse operations on first access and cached
+on the object.  The adjacency matrix of a surface loaded from a file is
+also stored next to that file, and reused by later loads of the same file
+until the file changes.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+
+from niio import geometry, loaded, smoothing
+
+
+class Surface(object):
+
+    """
+    Triangle mesh with cached topology.
+
+    >>> surf = Surface.load('L.midthickness.surf.gii')
+    >>> neighbors = surf.adjacency[v].indices
+    """
+
+    def __init__(self, vertices, faces, filename=None, persist=True):
+
+        """
+        Instantiate Surface object.
+
+        Parameters:
+        - - - - -
+        vertices: float, array
+            (n_vertices, 3) array of mesh vertices
+        faces: int, array
+            (n_faces, 3) array of mesh triangles
+        filename: str
+            file the mesh was loaded from, next to which derived data is
+            stored
+        persist: bool
+            store and reuse derived data next to filename
+        """
+
+        self.vertices = np.asarray(vertices)
+        self.faces = np.asarray(faces)
+        self.filename = filename
+        self.persist = persist and filename is not None
+
+        self._cache = {}
+
+    @classmethod
+    def load(cls, inFile, gifti=True, persist=True):
+
+        """
+        Load a surface file with loaded.loadSurf.
+
+        Parameters:
+        - - - - -
+        inFile: str
+            path to surface file
+        gifti: bool
+            file is a GIFTI file, rather than a FreeSurfer surface
+        persist: bool
+            store and reuse derived data, and the mesh cache of
+            loaded.loadSurf, next to inFile
+        """
+
+        vertices, faces = loaded.loadSurf(inFile, gifti=gifti, cache=persist)
+
+        return cls(vertices, faces, filename=inFile, persist=persist)
+
+    @property
+    def n_vertices(self):
+
+        return self.vertices.shape[0]
+
+    @property
+    def n_faces(self):
+
+        return self.faces.shape[0]
+
+    @property
+    def edges(self):
+
+        """
+        (n_edges, 2) array of unique undirected edges, with the smaller
+        vertex index first.
+        """
+
+        if 'edges' not in self._cache:
+
+            pairs = self.faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+            lo = pairs.min(1).astype(np.int64)
+            hi = pairs.max(1).astype(np.int64)
+
+            # unique on a single integer key is much faster than on rows
+            keys = np.unique(lo * self.n_vertices + hi)
+            self._cache['edges'] = np.column_stack(
+                [keys // self.n_vertices, keys % self.n_vertices])
+
+        return self._cache['edges']
+
+    @property
+    def adjacency(self):
+
+        """
+        (n_vertices, n_vertices) symmetric CSR matrix, with a one for each
+        pair of vertices connected by an edge.
+        """
+
+        if 'adjacency' not in self._cache:
+
+            A = self._read('adj')
+            if A is None:
+                e = self.edges
+                n = self.n_vertices
+                rows = np.concatenate([e[:, 0], e[:, 1]])
+                cols = np.concatenate([e[:, 1], e[:, 0]])
+                A = sparse.csr_matrix((np.ones(rows.size), (rows, cols)),
+                                      shape=(n, n))
+                self._write('adj', A)
+
+            self._cache['adjacency'] = A
+
+        return self._cache['adjacency']
+
+    @property
+    def vertex_faces(self):
+
+        """
+        (n_vertices, n_faces) CSR incidence matrix, with a one where a
+        vertex belongs to a face.  Row v lists the faces around vertex v.
+        """
+
+        if 'vertex_faces' not in self._cache:
+
+            rows = self.faces.ravel().astype(np.int64)
+            cols = np.repeat(np.arange(self.n_faces), 3)
+            self._cache['vertex_faces'] = sparse.csr_matrix(
+                (np.ones(rows.size), (rows, cols)),
+                shape=(self.n_vertices, self.n_faces))
+
+        return self._cache['vertex_faces']
+
+    @property
+    def face_areas(self):
+
+        """
+        (n_faces,) face areas.
+        """
+
+        return self._memo('face_areas', geometry.face_areas)
+
+    @property
+    def face_normals(self):
+
+        """
+        (n_faces, 3) unit face normals.
+        """
+
+        return self._memo('face_normals', geometry.face_normals)
+
+    @property
+    def vertex_areas(self):
+
+        """
+        (n_vertices,) vertex areas, one third of the area of adjacent faces.
+        """
+
+        if 'vertex_areas' not in self._cache:
+            self._cache['vertex_areas'] = geometry.vertex_areas(
+                self.vertices, self.faces, areas=self.face_areas)
+
+        return self._cache['vertex_areas']
+
+    @property
+    def vertex_normals(self):
+
+        """
+        (n_vertices, 3) unit vertex normals, area-weighted over adjacent
+        faces.
+        """
+
+        return self._memo('vertex_normals', geometry.vertex_normals)
+
+    @property
+    def area(self):
+
+        return self.face_areas.sum()
+
+    def parcel_areas(self, index_map):
+
+        """
+        Compute the surface area of each parcel.
+
+        Parameters:
+        - - - - -
+        index_map: dictionary, ParcelIndex or ParcelImage
+            parcellation of this surface's vertices
+        """
+
+        return geometry.parcel_areas(self.vertex_areas, index_map)
+
+    def neighbors(self, vertex):
+
+        """
+        Get the vertices adjacent to a vertex.
+
+        Parameters:
+        - - - - -
+        vertex: int
+            vertex index
+        """
+
+        A = self.adjacency
+
+        return A.indices[A.indptr[vertex]:A.indptr[vertex+1]]
+
+    def kring_matrix(self, k=1):
+
+        """
+        Boolean (n_vertices, n_vertices) CSR matrix, whose row v marks the
+        vertices within k edges of vertex v, including v itself.  Built as
+        the k-th power of the adjacency matrix plus identity, and cached per
+        k.  The number of stored entries grows roughly quadratically with k.
+
+        Parameters:
+        - - - - -
+        k: int
+            number of edges
+        """
+
+        key = ('kring', k)
+        if key not in self._cache:
+
+            step = self._kring_step()
+            R = sparse.identity(self.n_vertices, dtype=bool, format='csr')
+            for _ in range(k):
+                R = R @ step
+            R.sort_indices()
+
+            self._cache[key] = R
+
+        return self._cache[key]
+
+    def kring(self, vertices, k=1):
+
+        """
+        Get the vertices within k edges of each of a batch of vertices,
+        including the vertices themselves.
+
+        If kring_matrix(k) has been built, rows are read from it.  Otherwise,
+        the rings of all queried vertices grow together, one frontier per
+        sparse matrix product.
+
+        Parameters:
+        - - - - -
+        vertices: int, or int array
+            vertex indices
+        k: int
+            number of edges
+
+        Returns:
+        - - - -
+        rings: int array, or list of int arrays
+            sorted vertex indices within k edges of each vertex.  A single
+            array if vertices is a scalar.
+        """
+
+        seeds = np.atleast_1d(vertices).astype(np.int64)
+
+        key = ('kring', k)
+        if key in self._cache:
+            R = self._cache[key][seeds]
+        else:
+            m = len(seeds)
+            R = sparse.csr_matrix((np.ones(m, dtype=bool),
+                                   (np.arange(m), seeds)),
+                                  shape=(m, self.n_vertices))
+            step = self._kring_step()
+            for _ in range(k):
+                R = R @ step
+            R.sort_indices()
+
+        rings = np.split(R.indices, R.indptr[1:-1])
+
+        return rings[0] if np.ndim(vertices) == 0 else rings
+
+    @property
+    def kdtree(self):
+
+        """
+        scipy.spatial.cKDTree over the mesh vertices.
+        """
+
+        if 'kdtree' not in self._cache:
+
+            from scipy.spatial import cKDTree
+
+            self._cache['kdtree'] = cKDTree(self.vertices)
+
+        return self._cache['kdtree']
+
+    def nearest(self, points, return_distance=False, workers=-1):
+
+        """
+        Find the vertex closest to each of a batch of points.
+
+        Parameters:
+        - - - - -
+        points: float, array
+            (3,) point, or (n_points, 3) array of points
+        return_distance: bool
+            also return the distance to each vertex
+        workers: int
+            number of threads to query with.  -1 uses all processors.
+
+        Returns:
+        - - - -
+        index: int, or int array
+            index of the closest vertex to each point
+        distance: float, or float array
+            distance to the closest vertex, if return_distance is True
+        """
+
+        distance, index = self.kdtree.query(points, workers=workers)
+
+        if return_distance:
+            return index, distance
+
+        return index
+
+    def smoother(self, method='heat', fwhm=None, iterations=None,
+                 truncate=3.0):
+
+        """
+        Get a smoothing operator on this mesh, built on first use and cached
+        per set of parameters.  See smoothing.operator.
+
+        >>> Y = surf.smoother('heat', fwhm=6).apply(X, workers=8)
+        """
+
+        key = ('smoother', method, fwhm, iterations, truncate)
+        if key not in self._cache:
+            self._cache[key] = smoothing.operator(
+                self, method, fwhm=fwhm, iterations=iterations,
+                truncate=truncate)
+
+        return self._cache[key]
+
+    def _kring_step(self):
+
+        """
+        Boolean adjacency matrix plus identity, which grows a ring by one
+        edge when multiplied on the right.
+        """
+
+        if 'kring_step' not in self._cache:
+            A = self.adjacency.astype(bool)
+            self._cache['kring_step'] = \
+                (A + sparse.identity(self.n_vertices, dtype=bool,
+                                     format='csr')).tocsr()
+
+        return self._cache['kring_step']
+
+    def _memo(self, name, func):
+
+        if name not in self._cache:
+            self._cache[name] = func(self.vertices, self.faces)
+
+        return self._cache[name]
+
+    def _path(self, name):
+
+        return '{}.{}.npz'.format(self.filename, name)
+
+    def _read(self, name):
+
+        """
+        Read a sparse matrix stored next to the surface file, if the surface
+        file has not changed since it was stored.
+        """
+
+        if not self.persist:
+            return None
+
+        stored = loaded._readSidecar(self._path(name), self.filename,
+                                     ['data', 'indices', 'indptr', 'shape'])
+        if stored is None or \
+                tuple(stored['shape']) != (self.n_vertices, self.n_vertices):
+            return None
+
+        return sparse.csr_matrix(
+            (stored['data'], stored['indices'], stored['indptr']),
+            shape=tuple(stored['shape']))
+
+    def _write(self, name, M):
+
+        """
+        Store a sparse matrix next to the surface file, stamped with the
+        surface file's modification time and size, as loaded.loadSurf stamps
+        its mesh cache.  Failures, e.g. in read-only directories, are
+        ignored.
+        """
+
+        if not self.persist:
+            return
+
+        M = M.tocsr()
+        loaded._writeSidecar(self._path(name), self.filename, data=M.data,
+                             indices=M.indices, indptr=M.indptr,
+                             shape=np.array(M.shape))
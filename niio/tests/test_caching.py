@@ -0,0 +1,74 @@
+import os
+import pickle
+
+import numpy as np
+
+from niio import caching, loaded, write
+
+
+def test_fetch_caches_and_freezes(tmp_path):
+    "Check that a second fetch is a hit, and cached arrays are read-only."
+    path = str(tmp_path / 'data.npy')
+    write.save_npy(np.arange(10.), path)
+
+    cache = caching.ResultCache()
+    a = loaded.load(path, cache=cache)
+    b = loaded.load(path, cache=cache)
+    assert a is b
+    assert not a.flags.writeable
+    assert cache.stats()['hits'] == 1
+
+
+def test_oversized_results_stay_writable():
+    "Check that results too large to keep are not frozen."
+    cache = caching.ResultCache(max_bytes=10)
+    big = np.zeros(10)
+    cache.put('key', big)
+    assert big.flags.writeable
+    assert cache.stats()['entries'] == 0
+
+
+def test_out_bypasses_cache(tmp_path):
+    "Check that loads into an out buffer leave it writable and uncached."
+    path = str(tmp_path / 'data.func.gii')
+    write.save([np.arange(5.), np.ones(5)], path, 'L')
+
+    cache = caching.ResultCache()
+    out = np.empty((5, 2), dtype=np.float32)
+    for _ in range(2):
+        loaded.load(path, cache=cache, out=out)
+    assert out.flags.writeable
+    np.testing.assert_array_equal(out[:, 0], np.arange(5.))
+    assert cache.stats()['entries'] == 0
+
+
+def test_object_arrays_not_spilled(tmp_path):
+    "Check that object arrays stay in memory, and bad spill files are misses."
+    path = str(tmp_path / 'data.p')
+    with open(path, 'wb') as f:
+        pickle.dump(np.array([[1], 'a'], dtype=object), f)
+
+    cache_dir = str(tmp_path / 'cache')
+    loaded.load(path, cache=caching.ResultCache(cache_dir=cache_dir))
+    assert os.listdir(cache_dir) == []
+
+    # a spill file that cannot be memory-mapped is removed and reloaded
+    key = caching.make_key(path, {})
+    np.save(os.path.join(cache_dir, key + '.npy'),
+            np.array([None], dtype=object))
+    result = loaded.load(path, cache=caching.ResultCache(cache_dir=cache_dir))
+    assert result[1] == 'a'
+    assert os.listdir(cache_dir) == []
+
+
+def test_disk_budget(tmp_path):
+    "Check that the least recently used spill files are removed."
+    cache_dir = str(tmp_path / 'cache')
+    cache = caching.ResultCache(cache_dir=cache_dir, max_disk_bytes=2500)
+    for i, key in enumerate('abcde'):
+        cache.put(key, np.zeros(100))
+        path = os.path.join(cache_dir, key + '.npy')
+        os.utime(path, ns=(0, i * 10**9))
+
+    assert sorted(os.listdir(cache_dir)) == ['d.npy', 'e.npy']
+    assert cache.stats()['disk_evictions'] == 3
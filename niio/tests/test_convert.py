@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+import pytest
+
+from niio import convert, handles, write
+
+
+def _refs(path):
+
+    entry = handles.pool._entries.get(os.path.realpath(path))
+
+    return entry['refs'] if entry else 0
+
+
+def test_mat_columns_release(tmp_path):
+    "Check that .mat handles are released whether or not columns are read."
+    path = str(tmp_path / 'data.mat')
+    X = np.arange(20.).reshape(5, 4)
+    write.save_mat73((X[:, i] for i in range(4)), 4, path)
+
+    columns, count = convert._mat_columns(path)
+    assert count == 4
+    assert _refs(path) == 0
+    del columns
+    assert _refs(path) == 0
+
+    columns, _ = convert._mat_columns(path)
+    next(columns)
+    assert _refs(path) == 1
+    columns.close()
+    assert _refs(path) == 0
+
+    # a writer that fails before reading a column
+    with pytest.raises(ValueError):
+        convert.convert(path, str(tmp_path / 'data.func.gii'))
+    assert _refs(path) == 0
+
+    columns, _ = convert._mat_columns(path)
+    np.testing.assert_array_equal(np.column_stack(list(columns)), X)
+    assert _refs(path) == 0
+
+
+def test_h5_columns_release(tmp_path):
+    "Check that .h5 handles are released whether or not columns are read."
+    path = str(tmp_path / 'data.h5')
+    X = np.arange(20.).reshape(5, 4)
+    write.save_h5(X, path)
+
+    columns, count = convert._h5_columns(path)
+    assert count == 4
+    del columns
+    assert _refs(path) == 0
+
+    with pytest.raises(ValueError):
+        convert.convert(path, str(tmp_path / 'data.func.gii'))
+    assert _refs(path) == 0
+
+    columns, _ = convert._h5_columns(path)
+    np.testing.assert_array_equal(np.column_stack(list(columns)), X)
+    assert _refs(path) == 0
+
+
+EXTENSIONS = ['.mat', '.func.gii', '.h5', '.npy', '.p']
+
+
+def _opts(extension):
+
+    return {'hemisphere': 'L'} if extension.endswith('.gii') else {}
+
+
+@pytest.mark.parametrize('columns', [1, 3])
+@pytest.mark.parametrize('src_ext', EXTENSIONS)
+@pytest.mark.parametrize('dst_ext', EXTENSIONS)
+def test_convert_roundtrip(tmp_path, src_ext, dst_ext, columns):
+    "Check that data survives a conversion between any two formats."
+    rng = np.random.RandomState(0)
+    X = rng.rand(20, columns).astype(np.float32).squeeze()
+
+    npy = str(tmp_path / 'data.npy')
+    src = str(tmp_path / ('src' + src_ext))
+    dst = str(tmp_path / ('dst' + dst_ext))
+    back = str(tmp_path / 'back.npy')
+
+    write.save_npy(X, npy)
+    if src_ext != '.npy':
+        convert.convert(npy, src, **_opts(src_ext))
+    else:
+        src = npy
+    convert.convert(src, dst, **_opts(dst_ext))
+    convert.convert(dst, back)
+
+    Y = np.load(back)
+    assert Y.shape == X.shape
+    np.testing.assert_array_equal(Y, X)
+
+
+def test_convert_tree(tmp_path):
+    "Check that convert_tree mirrors the tree, and skips up to date outputs."
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    (src / 'sub').mkdir(parents=True)
+    X = np.arange(12.).reshape(6, 2)
+    for name in ['a.npy', 'sub/b.npy']:
+        write.save_npy(X, str(src / name))
+    (src / 'ignored.txt').write_text('not converted')
+
+    results = convert.convert_tree(str(src), str(dst), '.npy', '.h5',
+                                   workers=1)
+    assert len(results['converted']) == 2
+    assert not results['skipped'] and not results['failed']
+    assert os.path.exists(str(dst / 'sub' / 'b.h5'))
+    assert sorted(os.listdir(str(dst))) == ['a.h5', 'sub']
+
+    results = convert.convert_tree(str(src), str(dst), '.npy', '.h5',
+                                   workers=1)
+    assert len(results['skipped']) == 2 and not results['converted']
+
+    # a changed input is converted again
+    newer = os.stat(str(dst / 'a.h5')).st_mtime_ns + 10**9
+    os.utime(str(src / 'a.npy'), ns=(newer, newer))
+    results = convert.convert_tree(str(src), str(dst), '.npy', '.h5',
+                                   workers=1)
+    assert results['converted'] == [str(src / 'a.npy')]
+    assert len(results['skipped']) == 1
+
+    results = convert.convert_tree(str(src), str(dst), '.npy', '.h5',
+                                   workers=1, force=True)
+    assert len(results['converted']) == 2
+
+
+def test_main(tmp_path, capsys):
+    "Check that main passes --hemisphere only to writers that take it."
+    src = str(tmp_path / 'data.npy')
+    write.save_npy(np.arange(10.), src)
+
+    gii = str(tmp_path / 'data.func.gii')
+    assert convert.main([src, gii, '--hemisphere', 'R']) == 0
+    assert os.path.exists(gii)
+
+    # ignored by writers without a hemisphere
+    h5 = str(tmp_path / 'data.h5')
+    assert convert.main([src, h5, '--hemisphere', 'R']) == 0
+    assert os.path.exists(h5)
+
+    assert convert.main([str(tmp_path), str(tmp_path / 'out'), '--from',
+                         '.npy', '--to', '.p']) == 0
+    assert os.path.exists(str(tmp_path / 'out' / 'data.p'))
+    assert '1 converted' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('argv', [
+    ['{src}', '{tmp}/data.func.gii'],
+    ['{src}', '{tmp}/data.xyz'],
+    ['{tmp}/data.xyz', '{tmp}/data.npy'],
+    ['{tmp}', '{tmp}/out', '--from', '.xyz', '--to', '.npy'],
+    ['{tmp}', '{tmp}/out', '--from', '.npy']],
+    ids=['no-hemisphere', 'bad-output', 'bad-input', 'bad-tree-input',
+         'no-to'])
+def test_main_errors(tmp_path, argv):
+    "Check that main reports bad arguments as usage errors."
+    src = str(tmp_path / 'data.npy')
+    write.save_npy(np.arange(10.), src)
+    argv = [a.format(src=src, tmp=str(tmp_path)) for a in argv]
+
+    with pytest.raises(SystemExit) as e:
+        convert.main(argv)
+    assert e.value.code == 2
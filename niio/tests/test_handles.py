@@ -0,0 +1,118 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from niio import handles
+
+
+def _write(path, value):
+
+    # write next to the file and move it into place, as a rewrite that does
+    # not need to truncate a file the pool may hold open
+    temp = path + '.tmp'
+    with h5py.File(temp, 'w') as h5:
+        h5.create_dataset('data', data=np.full(3, value))
+    os.replace(temp, path)
+
+
+@pytest.fixture
+def files(tmp_path):
+
+    paths = [str(tmp_path / 'f{}.h5'.format(i)) for i in range(4)]
+    for i, path in enumerate(paths):
+        _write(path, i)
+
+    return paths
+
+
+def test_hits_and_misses(files):
+    "Check that a file is opened once, and its handle reused."
+    pool = handles.HandlePool()
+    h5 = pool.acquire(files[0])
+    pool.release(h5)
+    assert pool.acquire(files[0]) is h5
+    pool.release(h5)
+
+    stats = pool.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+    assert h5.id.valid
+
+
+def test_evicts_idle_handles_only(files):
+    "Check that eviction closes least recently used idle handles."
+    pool = handles.HandlePool(maxsize=2)
+    busy = pool.acquire(files[0])
+    idle = pool.acquire(files[1])
+    pool.release(idle)
+    other = pool.acquire(files[2])
+    pool.release(other)
+
+    # files[1] is the least recently used idle handle
+    assert not idle.id.valid
+    assert busy.id.valid and other.id.valid
+    assert pool.stats()['evictions'] == 1
+
+    # with every handle in use, the pool grows past maxsize
+    more = [pool.acquire(f) for f in files[2:]]
+    assert pool.stats()['size'] == 3
+    assert all(h.id.valid for h in more)
+
+    for h in [busy] + more:
+        pool.release(h)
+    assert pool.stats()['size'] == 2
+    assert sum(h.id.valid for h in [busy, other, more[1]]) == 2
+
+
+def test_reopens_rewritten_file(files):
+    "Check that a file changed on disk is re-opened, and the old handle kept."
+    pool = handles.HandlePool()
+    old = pool.acquire(files[0])
+
+    _write(files[0], 10)
+    os.utime(files[0], ns=(0, os.stat(files[0]).st_mtime_ns + 10**9))
+
+    new = pool.acquire(files[0])
+    assert new is not old
+    assert new['data'][0] == 10
+
+    # the retired handle stays open until released
+    assert old['data'][0] == 0
+    pool.release(old)
+    assert not old.id.valid
+    assert new.id.valid
+    pool.release(new)
+
+
+def test_flush_while_acquired(files):
+    "Check that flush closes idle handles now, and acquired ones on release."
+    pool = handles.HandlePool()
+    busy = pool.acquire(files[0])
+    idle = pool.acquire(files[1])
+    pool.release(idle)
+
+    pool.flush()
+    assert pool.stats()['size'] == 0
+    assert not idle.id.valid
+    assert busy['data'][0] == 0
+
+    pool.release(busy)
+    assert not busy.id.valid
+
+    # the next acquire opens a new handle
+    h5 = pool.acquire(files[0])
+    assert h5 is not busy and h5.id.valid
+    pool.release(h5)
+
+
+def test_discard(files):
+    "Check that discard removes a single file from the pool."
+    pool = handles.HandlePool()
+    a, b = pool.acquire(files[0]), pool.acquire(files[1])
+    pool.release(a)
+    pool.release(b)
+
+    pool.discard(files[0])
+    assert not a.id.valid and b.id.valid
+    assert pool.stats()['size'] == 1
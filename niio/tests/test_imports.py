@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+HEAVY = ['h5py', 'matplotlib', 'pandas', 'scipy.io']
+
+# Seconds allowed for "import niio" in a fresh interpreter.
+BUDGET = float(os.environ.get('NIIO_IMPORT_BUDGET', 0.5))
+
+
+def _run(code):
+
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True)
+
+    return out.stdout.split()
+
+
+@pytest.mark.parametrize('statement', [
+    'import niio',
+    'import niio; niio.loaded',
+    'from niio import loaded; loaded.load("data/func.gii")',
+])
+def test_no_heavy_imports(statement):
+    "Check that importing niio, and reading GIFTI, avoid heavy dependencies."
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    code = ('import os, sys; os.chdir({!r}); {}; '
+            'print(" ".join(m for m in {!r} if m in sys.modules))')
+    assert _run(code.format(root, statement, HEAVY)) == []
+
+
+def test_import_time():
+    "Check that importing niio stays within the import-time budget."
+    code = ('import time; t = time.perf_counter(); import niio; '
+            'print(time.perf_counter() - t)')
+    seconds = min(float(_run(code)[0]) for _ in range(3))
+    assert seconds < BUDGET
+
+
+def test_lazy_submodules():
+    "Check that submodules are imported on first access."
+    import niio
+    assert niio.loaded.__name__ == 'niio.loaded'
+    assert 'write' in dir(niio)
+    with pytest.raises(AttributeError):
+        niio.nonexistent
@@ -0,0 +1,115 @@
+import io
+import zipfile
+
+import numpy as np
+import pytest
+
+from niio import loaded, write
+
+
+def _write_npz(path, arrays, version, extra=b''):
+
+    """
+    Write an uncompressed .npz archive with a given .npy header version, and
+    an extra field in each local file header.
+    """
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for name, array in arrays.items():
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, array, version=version)
+            info = zipfile.ZipInfo(name + '.npy')
+            info.extra = extra
+            zf.writestr(info, buf.getvalue())
+
+
+@pytest.mark.parametrize('version', [(1, 0), (2, 0)])
+@pytest.mark.parametrize('extra', [b'', b'\xca\xfe\x04\x00abcd'],
+                         ids=['no-extra', 'extra'])
+def test_npz_memmap(tmp_path, version, extra):
+    "Check that uncompressed .npz members are memory-mapped at their offset."
+    path = str(tmp_path / 'data.npz')
+    rng = np.random.RandomState(0)
+    arrays = {'c': rng.rand(30, 4),
+              'f': np.asfortranarray(rng.rand(30, 4).astype(np.float32)),
+              'i': np.arange(7, dtype='>i4')}
+    _write_npz(path, arrays, version, extra)
+
+    data = loaded.loadNpy(path, mmap_mode='r')
+    for k, array in arrays.items():
+        assert isinstance(data[k], np.memmap)
+        assert data[k].dtype == array.dtype
+        assert data[k].flags.f_contiguous == array.flags.f_contiguous
+        np.testing.assert_array_equal(data[k], array)
+
+
+def test_npz_memmap_copy_on_write(tmp_path):
+    "Check that writing to a 'c' memmap leaves the archive intact."
+    path = str(tmp_path / 'data.npz')
+    write.save_npz({'a': np.zeros(10)}, path)
+
+    data = loaded.loadNpy(path, mmap_mode='c')
+    data['a'][:] = 1
+    with np.load(path) as npz:
+        np.testing.assert_array_equal(npz['a'], np.zeros(10))
+
+
+@pytest.mark.parametrize('mode', ['r+', 'w+'])
+def test_npz_memmap_writable(tmp_path, mode):
+    "Check that .npz archives cannot be memory-mapped for writing."
+    path = str(tmp_path / 'data.npz')
+    write.save_npz({'a': np.zeros(10)}, path)
+
+    with pytest.raises(ValueError):
+        loaded.loadNpy(path, mmap_mode=mode)
+    with np.load(path) as npz:
+        np.testing.assert_array_equal(npz['a'], np.zeros(10))
+
+
+def test_npz_compressed(tmp_path):
+    "Check that compressed .npz members are read into memory."
+    path = str(tmp_path / 'data.npz')
+    write.save_npz({'a': np.arange(10)}, path, compressed=True)
+
+    data = loaded.loadNpy(path, mmap_mode='r')
+    assert not isinstance(data['a'], np.memmap)
+    np.testing.assert_array_equal(data['a'], np.arange(10))
+
+
+def test_surf_cache(tmp_path):
+    "Check that cached meshes match the parsed mesh, and track the source."
+    import nibabel as nb
+
+    path = str(tmp_path / 'lh.white')
+    rng = np.random.RandomState(0)
+    faces = rng.randint(0, 10, size=(12, 3))
+    nb.freesurfer.write_geometry(path, rng.rand(10, 3), faces)
+
+    parsed = loaded.loadSurf(path, gifti=False)
+    cached = loaded.loadSurf(path, gifti=False)
+    assert isinstance(cached[0], np.memmap)
+    for p, c in zip(parsed, cached):
+        assert p.dtype == c.dtype
+        np.testing.assert_array_equal(p, c)
+
+    # rewriting the source invalidates the cache
+    nb.freesurfer.write_geometry(path, rng.rand(10, 3), faces[:6])
+    assert loaded.loadSurf(path, gifti=False)[1].shape == (6, 3)
+
+
+@pytest.mark.parametrize('datasets', [[], [0, 1], [1, 0], [1], [2, 1]])
+def test_gii_mixed_dtypes(tmp_path, datasets):
+    "Check that loadGii returns the common type of mixed DataArrays."
+    path = str(tmp_path / 'data.func.gii')
+    columns = [np.arange(5, dtype=np.int32), np.linspace(0, 1, 5),
+               np.arange(5, dtype=np.int32) * 2]
+    write.save(columns, path, 'L')
+
+    selected = [columns[i] for i in (datasets or range(len(columns)))]
+    stored = [c.astype(np.float32 if c.dtype.kind == 'f' else np.int32)
+              for c in selected]
+    expected = np.column_stack(stored).astype(np.result_type(*stored))
+
+    X = loaded.loadGii(path, datasets=datasets)
+    assert X.dtype == expected.dtype
+    np.testing.assert_array_equal(X, expected.squeeze())
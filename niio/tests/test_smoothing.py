@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from niio import smoothing
+from niio.surface import Surface
+from niio.tests.test_surface import _grid
+
+
+KERNELS = [('neighbor', None, 3), ('heat', 2.0, None), ('gaussian', 2.0, None)]
+
+
+@pytest.fixture
+def surf():
+
+    return Surface(*_grid(12))
+
+
+@pytest.mark.parametrize('method, fwhm, iterations', KERNELS)
+def test_kernel_rows(surf, method, fwhm, iterations):
+    "Check that each kernel averages: rows sum to one, constants are kept."
+    smoother = surf.smoother(method, fwhm=fwhm, iterations=iterations)
+    W = smoother.matrix
+    assert W.shape == (surf.n_vertices, surf.n_vertices)
+    assert (W.data >= 0).all()
+    np.testing.assert_allclose(np.asarray(W.sum(1)).ravel(), 1)
+
+    X = np.full((surf.n_vertices, 4), 3.5)
+    np.testing.assert_allclose(smoother.apply(X), X)
+
+
+@pytest.mark.parametrize('dtype, expected', [
+    (np.float32, np.float32), (np.float64, np.float64),
+    (np.int32, np.float64), (bool, np.float64)])
+def test_dtype(surf, dtype, expected):
+    "Check that floating point data keeps its type."
+    X = (np.arange(surf.n_vertices * 2) % 2).reshape(-1, 2).astype(dtype)
+    Y = surf.smoother('heat', fwhm=2.0).apply(X)
+    assert Y.dtype == expected
+    assert Y.shape == X.shape
+
+    y = surf.smoother('heat', fwhm=2.0).apply(X[:, 0])
+    assert y.dtype == expected and y.shape == (surf.n_vertices,)
+
+
+@pytest.mark.parametrize('method, fwhm, iterations', KERNELS)
+@pytest.mark.parametrize('chunk, workers', [
+    (1, None), (3, None), (None, 2), (2, 3), (100, 4)])
+def test_chunks(surf, method, fwhm, iterations, chunk, workers):
+    "Check that chunked and threaded smoothing matches a single block."
+    rng = np.random.RandomState(0)
+    X = rng.rand(surf.n_vertices, 7)
+    smoother = surf.smoother(method, fwhm=fwhm, iterations=iterations)
+
+    expected = smoother.apply(X)
+    np.testing.assert_allclose(
+        smoother.apply(X, chunk=chunk, workers=workers), expected,
+        rtol=1e-12)
+    np.testing.assert_allclose(
+        smoothing.smooth(X, surf, method, fwhm=fwhm, iterations=iterations,
+                         chunk=chunk, workers=workers), expected, rtol=1e-12)
+
+
+def test_iterations(surf):
+    "Check that iterations apply the step matrix repeatedly."
+    rng = np.random.RandomState(0)
+    X = rng.rand(surf.n_vertices)
+    smoother = surf.smoother('neighbor', iterations=3)
+
+    W = smoother.matrix
+    np.testing.assert_allclose(smoother.apply(X), W @ (W @ (W @ X)))
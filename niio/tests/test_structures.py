@@ -0,0 +1,74 @@
+import numpy as np
+import pandas
+import pytest
+
+from niio import structures
+
+
+HOW = ['mean', 'median', 'sum', 'std', 'min', 'max', 'count']
+
+
+@pytest.fixture
+def parcels():
+
+    rng = np.random.RandomState(0)
+    vertices = rng.permutation(60)
+
+    # parcels of odd and even size, a single vertex, an all-NaN parcel and
+    # an empty parcel.  Vertices 51-59 are in no parcel.
+    index_map = {'odd': vertices[:7], 'even': vertices[7:19],
+                 'single': vertices[19:20], 'nan': vertices[20:25],
+                 'empty': np.array([], dtype=int), 'big': vertices[25:51]}
+
+    X = rng.rand(60, 3)
+    X[rng.rand(60, 3) < 0.2] = np.nan
+    X[index_map['nan']] = np.nan
+
+    return index_map, X
+
+
+@pytest.mark.parametrize('how', HOW)
+def test_reduce_matches_pandas(parcels, how):
+    "Check ParcelImage.reduce against pandas groupby."
+    index_map, X = parcels
+    image = structures.ParcelImage(index_map, rows=len(X), columns=3)
+    R = image.reduce(X, how=how)
+
+    labels = pandas.Series(np.full(len(X), None, dtype=object))
+    for name, vertices in index_map.items():
+        labels[vertices] = name
+    groups = pandas.DataFrame(X).groupby(labels)
+
+    if how == 'std':
+        expected = groups.std(ddof=0)
+    else:
+        expected = groups.agg(how)
+    expected = expected.reindex(list(index_map.keys()))
+    if how in ['sum', 'count']:
+        expected = expected.fillna(0)
+
+    assert list(R.index) == list(index_map.keys())
+    np.testing.assert_allclose(R.values, expected.values.astype(float))
+
+
+def test_reduce_empty_parcels(parcels):
+    "Check the values of parcels without any non-NaN value."
+    index_map, X = parcels
+    image = structures.ParcelImage(index_map, rows=len(X), columns=3)
+
+    for how in HOW:
+        R = image.reduce(X, how=how)
+        for name in ['nan', 'empty']:
+            if how in ['sum', 'count']:
+                assert (R.loc[name] == 0).all()
+            else:
+                assert R.loc[name].isnull().all()
+
+
+def test_reduce_vector(parcels):
+    "Check that a single map reduces to a single column."
+    index_map, X = parcels
+    image = structures.ParcelImage(index_map, rows=len(X))
+    R = image.reduce(X[:, 0], how='mean')
+    np.testing.assert_allclose(
+        R.values[:, 0], image.reduce(X, how='mean').values[:, 0])
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from niio import write
+from niio.surface import Surface
+
+
+def _grid(n=8):
+
+    """
+    Flat n by n grid of vertices, split into two triangles per square.
+    """
+
+    gx, gy = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    vertices = np.column_stack([gx.ravel(), gy.ravel(), np.zeros(n * n)])
+
+    ii, jj = np.meshgrid(np.arange(n - 1), np.arange(n - 1), indexing='ij')
+    v0 = (ii * n + jj).ravel()
+    faces = np.concatenate([np.column_stack([v0, v0 + 1, v0 + n]),
+                            np.column_stack([v0 + 1, v0 + n + 1, v0 + n])])
+
+    return vertices.astype(np.float32), faces.astype(np.int32)
+
+
+@pytest.mark.parametrize('persist', [True, False])
+def test_load_persist(tmp_path, persist):
+    "Check that persist=False writes nothing next to the surface file."
+    path = str(tmp_path / 'mesh.surf.gii')
+    vertices, faces = _grid()
+    write.save_surf(vertices, faces, path, 'CortexLeft')
+
+    surf = Surface.load(path, persist=persist)
+    surf.adjacency
+    np.testing.assert_array_equal(surf.faces, faces)
+
+    stored = sorted(os.listdir(str(tmp_path)))
+    if persist:
+        assert stored == ['mesh.surf.gii', 'mesh.surf.gii.adj.npz',
+                          'mesh.surf.gii.mesh.npz']
+    else:
+        assert stored == ['mesh.surf.gii']
+
+
+def _bfs(faces, vertex, k):
+
+    neighbors = {}
+    for a, b in [(0, 1), (1, 2), (2, 0)]:
+        for u, v in zip(faces[:, a], faces[:, b]):
+            neighbors.setdefault(u, set()).add(v)
+            neighbors.setdefault(v, set()).add(u)
+
+    ring, frontier = {vertex}, {vertex}
+    for _ in range(k):
+        frontier = set().union(*(neighbors[v] for v in frontier)) - ring
+        ring |= frontier
+
+    return np.array(sorted(ring))
+
+
+@pytest.mark.parametrize('cached', [False, True])
+@pytest.mark.parametrize('k', [0, 1, 2, 3])
+def test_kring(k, cached):
+    "Check kring against breadth-first search, with and without kring_matrix."
+    vertices, faces = _grid()
+    surf = Surface(vertices, faces)
+    if cached:
+        surf.kring_matrix(k)
+
+    seeds = [0, 7, 27, 36, 63]
+    rings = surf.kring(seeds, k=k)
+    assert len(rings) == len(seeds)
+    for seed, ring in zip(seeds, rings):
+        np.testing.assert_array_equal(ring, _bfs(faces, seed, k))
+
+    np.testing.assert_array_equal(surf.kring(27, k=k), _bfs(faces, 27, k))
+
+    # rows of the matrix are the rings of every vertex
+    if cached:
+        R = surf.kring_matrix(k)
+        for v in range(surf.n_vertices):
+            np.testing.assert_array_equal(
+                R.indices[R.indptr[v]:R.indptr[v+1]], _bfs(faces, v, k))
+
+
+def test_nearest():
+    "Check nearest against a brute force search."
+    vertices, faces = _grid()
+    surf = Surface(vertices, faces)
+
+    rng = np.random.RandomState(0)
+    points = rng.rand(100, 3) * 8 - 0.5
+    D = np.linalg.norm(points[:, None] - vertices[None], axis=2)
+
+    index, distance = surf.nearest(points, return_distance=True)
+    np.testing.assert_array_equal(index, D.argmin(1))
+    np.testing.assert_allclose(distance, D.min(1), rtol=1e-6)
+
+    assert surf.nearest(points[0]) == D[0].argmin()
@@ -0,0 +1,139 @@
+import nibabel as nb
+import numpy as np
+import pytest
+
+from niio import gifti, loaded, write
+
+
+ENCODINGS = ['ASCII', 'Base64Binary', 'GZipBase64Binary', 'ExternalFileBinary']
+
+# input type, and the type write.save stores it as
+DTYPES = [(np.float64, np.float32), (np.float32, np.float32),
+          (np.int64, np.int32), (np.int32, np.int32), (np.uint8, np.uint8),
+          (bool, np.int32)]
+
+
+def _columns(dtype, rows=50, columns=3):
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(rows, columns) * 100
+
+    return [X[:, i].astype(dtype) for i in range(columns)]
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('dtype, stored', DTYPES)
+def test_save_roundtrip(tmp_path, encoding, dtype, stored):
+    "Check that write.save output reads back with nibabel and loadGii."
+    output = str(tmp_path / 'data.func.gii')
+    columns = _columns(dtype)
+    write.save(columns, output, 'L', encoding=encoding)
+
+    gii = nb.load(output)
+    assert len(gii.darrays) == len(columns)
+    assert gii.meta['AnatomicalStructurePrimary'] == 'CortexLeft'
+    for darray, column in zip(gii.darrays, columns):
+        assert darray.data.dtype == stored
+        np.testing.assert_array_equal(darray.data, column.astype(stored))
+
+    X = loaded.loadGii(output)
+    assert X.dtype == stored
+    np.testing.assert_array_equal(X, np.column_stack(columns).astype(stored))
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_save_count(tmp_path, encoding):
+    "Check that write.save writes DataArrays from a generator."
+    output = str(tmp_path / 'data.func.gii')
+    columns = _columns(np.float32)
+    write.save((c for c in columns), output, 'R', encoding=encoding,
+               count=len(columns))
+
+    gii = nb.load(output)
+    assert gii.meta['AnatomicalStructurePrimary'] == 'CortexRight'
+    np.testing.assert_array_equal(
+        np.column_stack([d.data for d in gii.darrays]),
+        np.column_stack(columns))
+
+    with pytest.raises(ValueError):
+        write.save((c for c in columns), output, 'R', encoding=encoding,
+                   count=len(columns) + 1)
+
+
+def test_save_external_offsets(tmp_path):
+    "Check that external DataArrays are stored back to back in the .dat file."
+    output = str(tmp_path / 'data.func.gii')
+    columns = _columns(np.float32, rows=1000, columns=4)
+    write.save(columns, output, 'L', encoding='ExternalFileBinary')
+
+    nbytes = columns[0].nbytes
+    headers = gifti.read_headers(output)
+    assert [h['ExternalFileName'] for h in headers] == \
+        ['data.func.gii.dat'] * len(columns)
+    assert [int(h['ExternalFileOffset']) for h in headers] == \
+        [i * nbytes for i in range(len(columns))]
+
+    raw = np.fromfile(output + '.dat', dtype=np.float32)
+    np.testing.assert_array_equal(raw, np.concatenate(columns))
+
+    X = loaded.loadGii(output, mmap=True)
+    assert isinstance(X, np.memmap)
+    np.testing.assert_array_equal(X, np.column_stack(columns))
+    np.testing.assert_array_equal(loaded.loadGii(output, datasets=[2]),
+                                  columns[2])
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_save_surf_roundtrip(tmp_path, encoding):
+    "Check that write.save_surf output reads back with nibabel and loadSurf."
+    output = str(tmp_path / 'mesh.surf.gii')
+    rng = np.random.RandomState(0)
+    vertices = rng.rand(100, 3).astype(np.float32)
+    faces = rng.randint(0, 100, size=(150, 3)).astype(np.int32)
+    write.save_surf(vertices, faces, output, 'CortexLeft', encoding=encoding)
+
+    gii = nb.load(output)
+    np.testing.assert_array_equal(gii.darrays[0].data, vertices)
+    np.testing.assert_array_equal(gii.darrays[1].data, faces)
+    assert gii.darrays[0].meta['AnatomicalStructurePrimary'] == 'CortexLeft'
+
+    V, F = loaded.loadSurf(output, cache=False)
+    np.testing.assert_array_equal(V, vertices)
+    np.testing.assert_array_equal(F, faces)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_column_major_roundtrip(tmp_path, encoding):
+    "Check that column-major DataArrays are not stored transposed."
+    source = str(tmp_path / 'source.func.gii')
+    output = str(tmp_path / 'data.func.gii')
+    data = np.arange(12, dtype=np.float32).reshape(4, 3)
+    darray = nb.gifti.GiftiDataArray(data, ordering='ColumnMajorOrder',
+                                     encoding='GIFTI_ENCODING_B64BIN')
+    nb.save(nb.gifti.GiftiImage(darrays=[darray]), source)
+
+    gii = nb.load(source)
+    np.testing.assert_array_equal(gii.darrays[0].data, data)
+    write._write_gifti(output, gii.darrays, gii.meta, encoding)
+
+    np.testing.assert_array_equal(nb.load(output).darrays[0].data, data)
+    np.testing.assert_array_equal(loaded.loadGii(output), data)
+    if encoding == 'ExternalFileBinary':
+        np.testing.assert_array_equal(loaded.loadGii(output, mmap=True), data)
+
+
+def test_func2external_column_major(tmp_path):
+    "Check that func2external keeps the layout of column-major DataArrays."
+    from niio import convert
+
+    source = str(tmp_path / 'source.func.gii')
+    output = str(tmp_path / 'data.func.gii')
+    data = np.arange(12, dtype=np.float32).reshape(4, 3)
+    darray = nb.gifti.GiftiDataArray(data, ordering='ColumnMajorOrder',
+                                     encoding='GIFTI_ENCODING_B64BIN')
+    nb.save(nb.gifti.GiftiImage(darrays=[darray]), source)
+
+    convert.func2external(source, output)
+    X = loaded.loadGii(output, mmap=True)
+    assert isinstance(X, np.memmap)
+    np.testing.assert_array_equal(X, data)
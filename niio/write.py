@@ -7,10 +7,58 @@ Created on Wed Oct 11 15:23:17 2017
 """
 
 import nibabel as nb
+from nibabel.gifti.util import gifti_encoding_codes
+from nibabel.nifti1 import data_type_codes
 import numpy as np
 
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                FIRST_COMPLETED, wait)
+import base64
+import io
+import os
+import time
+import xml.etree.ElementTree as ET
+import zlib
+
+from niio import handles
+
+
+ENCODINGS = ['ASCII', 'Base64Binary', 'GZipBase64Binary', 'ExternalFileBinary']
+
+MATLAB_CLASS = {'float64': 'double', 'float32': 'single',
+                'int8': 'int8', 'int16': 'int16', 'int32': 'int32',
+                'int64': 'int64', 'uint8': 'uint8', 'uint16': 'uint16',
+                'uint32': 'uint32', 'uint64': 'uint64'}
+
+GIFTI_HEADER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE GIFTI SYSTEM "http://www.nitrc.org/frs/download.php/115/gifti.dtd">
+"""
+
+
+def save_any(data, output, **kwargs):
 
-def save(func, output, hemisphere=None):
+    """
+    Wrapper method to save data, choosing the format by file extension.
+
+    Parameters:
+    - - - - -
+    data : data to save
+    output : output file name
+    kwargs : passed to the writer for the file type
+    """
+
+    filename, file_extension = os.path.splitext(output)
+
+    function_map = {'.gii': save,
+                    '.h5': save_h5,
+                    '.npy': save_npy,
+                    '.npz': save_npz}
+
+    return function_map[file_extension](data, output, **kwargs)
+
+
+def save(func, output, hemisphere=None, encoding='GZipBase64Binary',
+         compression_level=6, dtype=None, count=None):
     """
     Save a vector as a *.func.gii file.
 
@@ -19,6 +67,18 @@ def save(func, output, hemisphere=None):
     dataVector : list of vectors to save as Gifti file
     output : output file name
     hemisphere : 'CortexLeft' or 'CortexRight', depending on hemisphere
+    encoding : 'ASCII', 'Base64Binary', 'GZipBase64Binary' or
+                'ExternalFileBinary'.  Base64Binary skips compression, which
+                is much faster to write.  ExternalFileBinary writes raw data
+                to a sidecar output + '.dat' file, which can be
+                memory-mapped when read back.
+    compression_level : zlib compression level, 1-9, for GZipBase64Binary
+    dtype : data type to save.  By default, integer and boolean data (e.g.
+                labels) are saved as int32, uint8 as uint8, and everything
+                else as float32.
+    count : number of vectors, if dataVector is an iterator (e.g. a
+                generator) rather than a list.  Vectors are then encoded
+                and written one at a time, as they are generated.
 
     Example:
     - - - -
@@ -39,24 +99,235 @@ def save(func, output, hemisphere=None):
                                         value=hemisphere)
     metaData = nb.gifti.GiftiMetaData(nvPair)
 
-    # Generate GiftiImage object containing data vector and meta data
-    gifti_image = nb.gifti.GiftiImage(meta=metaData)
+    if count is None:
+        if not isinstance(func, list):
+            func = [func]
+        count = len(func)
+
+    darrays = (nb.gifti.GiftiDataArray(
+        data=_gifti_dtype(np.asarray(dv).squeeze(), dtype)) for dv in func)
+
+    _write_gifti(output, darrays, metaData, encoding, compression_level,
+                 count=count)
+
+
+def _gifti_dtype(array, dtype=None):
+
+    """
+    Cast an array to a data type supported by GIFTI.
+    """
+
+    if dtype is None:
+        if array.dtype == np.uint8:
+            dtype = np.uint8
+        elif array.dtype.kind in 'biu':
+            dtype = np.int32
+        else:
+            dtype = np.float32
+
+    return array.astype(dtype, copy=False)
+
+
+def _write_gifti(output, darrays, meta=None, encoding='GZipBase64Binary',
+                 compression_level=6, labeltable=None, count=None):
+
+    """
+    Write GiftiDataArrays to a GIFTI file, one DataArray at a time.
+
+    nibabel always compresses at the default zlib level, rounds ASCII floats
+    to six decimals and cannot write external data files, so the Data
+    element of each DataArray is encoded here.  niio/tests/test_write.py
+    checks that the output reads back with nibabel.
+
+    Parameters:
+    - - - - -
+    output: string
+        output file name
+    darrays: iterable
+        GiftiDataArray objects
+    meta: GiftiMetaData
+        image meta data
+    encoding: string
+        GIFTI encoding of every DataArray
+    compression_level: int
+        zlib compression level for GZipBase64Binary
+    labeltable: GiftiLabelTable
+        image label table
+    count: int
+        number of DataArrays, if darrays is an iterator.  Each DataArray
+        is then serialized and released before the next one is generated.
+    """
+
+    assert encoding in ENCODINGS
+
+    if count is None:
+        darrays = list(darrays)
+        count = len(darrays)
+
+    image = nb.gifti.GiftiImage(meta=meta, labeltable=labeltable)
+    root = image._to_xml_element()
+    root.set('NumberOfDataArrays', str(count))
 
-    if isinstance(func, list):
-        for dv in func:
+    # split the (otherwise empty) image at its closing tag, so that
+    # DataArrays can be written in between
+    xml = ET.tostring(root, encoding='unicode').encode('utf-8')
+    opening, closing = xml.rsplit(b'</GIFTI>', 1)
 
-            newVector = np.asarray(dv).squeeze().astype(np.float32)
-            gda = nb.gifti.GiftiDataArray(data=newVector)
-            gifti_image.add_gifti_data_array(gda)
+    external = None
+    if encoding == 'ExternalFileBinary':
+        external = open(output + '.dat', 'wb')
+
+    try:
+        with open(output, 'wb') as f:
+            f.write(GIFTI_HEADER + opening)
+            written = 0
+            for gda in darrays:
+                f.write(_darray_xml(gda, encoding, compression_level,
+                                    external, output))
+                written += 1
+            if written != count:
+                raise ValueError('Expected {} DataArrays, got {}.'.format(
+                    count, written))
+            f.write(b'</GIFTI>' + closing)
+    finally:
+        if external is not None:
+            external.close()
+
+
+def _darray_xml(gda, encoding, compression_level=6, external=None,
+                output=None):
+
+    """
+    Serialize a single GiftiDataArray to XML.
+
+    Parameters:
+    - - - - -
+    gda: GiftiDataArray
+        data array to serialize
+    encoding: string
+        GIFTI encoding
+    compression_level: int
+        zlib compression level for GZipBase64Binary
+    external: file
+        open binary file that data is appended to, for ExternalFileBinary
+    output: string
+        name of GIFTI file, relative to which external files are named
+    """
+
+    # let nibabel write everything but the data itself
+    gda.encoding = gifti_encoding_codes.code['undef']
+    element = gda._to_xml_element()
+    element.set('Encoding', encoding)
+
+    # data is always written in C order, whatever order the DataArray was
+    # read with, and readers disagree on the order of ASCII data
+    element.set('ArrayIndexingOrder', 'RowMajorOrder')
+
+    dtype = data_type_codes.dtype[gda.datatype]
+    data = np.ascontiguousarray(gda.data, dtype=dtype)
+    raw = data.tobytes()
+
+    if encoding == 'ASCII':
+        element.find('Data').text = _ascii(data)
+
+    elif encoding == 'Base64Binary':
+        element.find('Data').text = base64.b64encode(raw).decode('ascii')
+
+    elif encoding == 'GZipBase64Binary':
+        text = base64.b64encode(zlib.compress(raw, compression_level))
+        element.find('Data').text = text.decode('ascii')
 
     else:
-        newVector = np.asarray(func).squeeze().astype(np.float32)
-        gda = nb.gifti.GiftiDataArray(data=newVector)
-        gifti_image.add_gifti_data_array(gda)
+        element.set('ExternalFileName',
+                    os.path.basename(external.name))
+        element.set('ExternalFileOffset', str(external.tell()))
+        external.write(raw)
+
+    return ET.tostring(element, encoding='unicode').encode('utf-8')
+
+
+def save_many(jobs, workers=None, max_in_flight=None, executor='process'):
+
+    """
+    Save many vectors to *.func.gii files in parallel.
 
-    nb.save(gifti_image, output)
+    A failure to write one file does not stop the others.  Jobs are
+    consumed lazily, and at most max_in_flight of them are submitted at
+    once, which bounds the memory held by pending arrays when jobs is a
+    generator.
 
-def save_surf(vertices, triangles, output, hemisphere=None):
+    Parameters:
+    - - - - -
+    jobs : iterable of (func, output, hemisphere) tuples, each passed to
+            save.  A fourth element, if present, is a dictionary of keyword
+            arguments for save, e.g. {'encoding': 'Base64Binary'}.
+    workers : number of processes or threads
+    max_in_flight : maximum number of jobs submitted but not finished.
+                    Defaults to twice the number of workers.
+    executor : 'process' or 'thread'
+
+    Returns:
+    - - - -
+    results : list of dictionaries, one per job and in the same order,
+                with the output name, seconds spent, and error message
+                (None if the file was written)
+
+    Example:
+    - - - -
+    >>> jobs = ((maps[s], '{}.func.gii'.format(s), 'L') for s in subjects)
+    >>> failed = [r for r in save_many(jobs, workers=8) if r['error']]
+    """
+
+    executors = {'thread': ThreadPoolExecutor,
+                 'process': ProcessPoolExecutor}
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    results = {}
+
+    def collect(done):
+        for future in done:
+            i, output = pending.pop(future)
+            try:
+                seconds, error = future.result()
+            except Exception as e:
+                # e.g. job could not be sent to a worker process
+                seconds, error = 0.0, repr(e)
+            results[i] = {'output': output, 'seconds': seconds,
+                          'error': error}
+
+    with executors[executor](max_workers=workers) as pool:
+
+        pending = {}
+        for i, job in enumerate(jobs):
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(_timed_save, *job)] = (i, job[1])
+
+        collect(wait(pending).done)
+
+    return [results[i] for i in range(len(results))]
+
+
+def _timed_save(func, output, hemisphere=None, kwargs=None):
+
+    """
+    Run save, returning time taken and error message instead of raising.
+    """
+
+    start = time.perf_counter()
+    try:
+        save(func, output, hemisphere, **(kwargs or {}))
+    except Exception as e:
+        return time.perf_counter() - start, repr(e)
+
+    return time.perf_counter() - start, None
+
+
+def save_surf(vertices, triangles, output, hemisphere=None,
+              encoding='GZipBase64Binary', compression_level=6):
 
     """
     Save a list of vertices and triangles to a surface file.
@@ -71,6 +342,10 @@ def save_surf(vertices, triangles, output, hemisphere=None):
         output file name
     hemisphere: string
         'CortexLeft' or 'CortexRight'
+    encoding: string
+        GIFTI encoding, see save
+    compression_level: int
+        zlib compression level, 1-9, for GZipBase64Binary
     """
 
     # Initialize meta-data dictionary structure
@@ -95,15 +370,199 @@ def save_surf(vertices, triangles, output, hemisphere=None):
                                        datatype='NIFTI_TYPE_FLOAT32',
                                        coordsys=coordsys,
                                        data=vertices,
-                                       encoding='GZipBase64Binary',
                                        meta=meta)
 
     # Initialize data array of triangles
     d1 = nb.gifti.gifti.GiftiDataArray(intent='NIFTI_INTENT_TRIANGLE',
                                     datatype='NIFTI_TYPE_INT32',
                                     coordsys=coordsys,
-                                    data=triangles,
-                                    encoding='GZipBase64Binary')
+                                    data=triangles)
+
+    _write_gifti(output, [d0, d1], None, encoding, compression_level)
+
+
+def _ascii(data):
+
+    """
+    Format an array as GIFTI ASCII data, one row per line.  Floats are
+    written with enough digits to read back exactly, where nibabel rounds
+    them to six decimals.
+    """
+
+    if data.dtype.kind in 'biu':
+        fmt = '%d'
+    elif data.dtype.itemsize <= 4:
+        fmt = '%.9g'
+    else:
+        fmt = '%.17g'
+
+    rows = data.reshape(len(data), -1) if data.ndim else data.reshape(1, 1)
+    buf = io.StringIO()
+    np.savetxt(buf, rows, fmt=fmt)
+
+    return buf.getvalue()
+
+
+def save_h5(data, output, dataset='data', chunks=None, compression='gzip',
+            compression_opts=None, shuffle=False):
+
+    """
+    Save arrays to an hdf5 file.
+
+    Datasets are chunked, so that loaded.loadH5(..., lazy=True) can read a
+    slice of a large matrix by decompressing only the chunks it touches.
+
+    Parameters:
+    - - - - -
+    data: array, or dictionary of arrays
+        data to save.  Dictionary keys are used as dataset names.
+    output: string
+        output file name
+    dataset: string
+        dataset name, if data is a single array
+    chunks: tuple, or bool
+        chunk shape.  If None, chunks span whole rows and hold about 1 MiB,
+        which suits row-wise reads of vertex-by-vertex matrices.  If True,
+        h5py guesses a chunk shape.
+    compression: string
+        'gzip', 'lzf', or None
+    compression_opts: int
+        gzip compression level, 0-9
+    shuffle: bool
+        apply the byte-shuffle filter before compression, which usually
+        improves compression of floating point data
+
+    Example:
+    - - - -
+    >>> save_h5(connectivity, 'connectivity.h5', compression='lzf')
+    """
+
+    import h5py
+
+    if not isinstance(data, dict):
+        data = {dataset: data}
+
+    # a pooled read handle would prevent h5py from truncating the file
+    handles.discard(output)
+
+    with h5py.File(output, 'w') as h5:
+        for k, v in data.items():
+
+            v = np.asarray(v)
+
+            # scalars and empty arrays cannot be chunked or filtered
+            if not v.ndim or not v.size:
+                h5.create_dataset(k, data=v)
+                continue
+
+            shape = _row_chunks(v) if chunks is None else chunks
+            h5.create_dataset(k, data=v,
+                              chunks=shape,
+                              compression=compression,
+                              compression_opts=compression_opts,
+                              shuffle=shuffle)
+
+
+def save_mat73(columns, count, output, key='data'):
+
+    """
+    Save vectors from an iterable as the columns of a MATLAB v7.3 .mat file,
+    holding only one vector in memory at a time.
+
+    MATLAB v7.3 files are hdf5 files with a 512-byte MATLAB header, and
+    store matrices transposed, so that each column is one contiguous row of
+    the hdf5 dataset.
+
+    Parameters:
+    - - - - -
+    columns: iterable
+        vectors of equal length, e.g. a generator
+    count: int
+        number of vectors
+    output: string
+        output file name
+    key: string
+        MATLAB variable name
+    """
+
+    import h5py
+
+    # a pooled read handle would prevent h5py from truncating the file
+    handles.discard(output)
+
+    with h5py.File(output, 'w', userblock_size=512) as h5:
+
+        data = None
+        for i, column in enumerate(columns):
+
+            column = np.asarray(column).ravel()
+            if data is None:
+                data = h5.create_dataset(key, shape=(count, column.size),
+                                         dtype=column.dtype)
+                data.attrs['MATLAB_class'] = np.bytes_(
+                    MATLAB_CLASS[column.dtype.name])
+            data[i] = column
+
+    # MATLAB recognizes v7.3 files by the text, version and endian
+    # indicator in the first 128 bytes of the userblock
+    text = 'MATLAB 7.3 MAT-file, Platform: GLNXA64, Created on: {} ' \
+           'HDF5 schema 1.00 .'.format(time.strftime('%a %b %d %H:%M:%S %Y'))
+    header = text.ljust(116).encode('ascii') + b' ' * 8 + b'\x00\x02IM'
+
+    with open(output, 'r+b') as f:
+        f.write(header)
+
+
+def save_npy(data, output):
+
+    """
+    Save an array to a numpy .npy file, which loaded.loadNpy can
+    memory-map.
+
+    Parameters:
+    - - - - -
+    data: array
+        data to save
+    output: string
+        output file name
+    """
+
+    np.save(output, np.asarray(data))
+
+
+def save_npz(data, output, dataset='data', compressed=False):
+
+    """
+    Save arrays to a numpy .npz file.
+
+    Parameters:
+    - - - - -
+    data: array, or dictionary of arrays
+        data to save.  Dictionary keys are used as array names.
+    output: string
+        output file name
+    dataset: string
+        array name, if data is a single array
+    compressed: bool
+        compress arrays.  Compressed arrays cannot be memory-mapped.
+    """
+
+    if not isinstance(data, dict):
+        data = {dataset: data}
+
+    if compressed:
+        np.savez_compressed(output, **data)
+    else:
+        np.savez(output, **data)
+
+
+def _row_chunks(array, nbytes=2**20):
+
+    """
+    Chunk shape spanning whole rows of an array, holding about nbytes.
+    """
+
+    rowbytes = array.itemsize * int(np.prod(array.shape[1:]))
+    rows = int(min(array.shape[0], max(1, nbytes // max(rowbytes, 1))))
 
-    S = nb.gifti.gifti.GiftiImage(darrays=[d0,d1])
-    S.to_filename(output)
+    return (rows,) + array.shape[1:]
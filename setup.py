@@ -7,10 +7,11 @@ import versioneer
 # NOTE: This file must remain Python 2 compatible for the foreseeable future,
 # to ensure that we error out properly for people with outdated setuptools
 # and/or pip.
-if sys.version_info < (3, 6):
+min_version = (3, 7)
+if sys.version_info < min_version:
     error = """
-niio does not support Python {0}.{2}.
-Python 3.6 and above is required. Check your Python version like so:
+niio does not support Python {0}.{1}.
+Python {2}.{3} and above is required. Check your Python version like so:
 
 python3 --version
 
@@ -18,7 +19,7 @@ This may be due to an out-of-date pip. Make sure you have pip >= 9.0.1.
 Upgrade pip like so:
 
 pip install --upgrade pip
-""".format(3, 6)
+""".format(*(sys.version_info[:2] + min_version))
     sys.exit(error)
 
 here = path.abspath(path.dirname(__file__))
@@ -44,7 +45,7 @@ setup(
     packages=find_packages(exclude=['docs', 'tests']),
     entry_points={
         'console_scripts': [
-            # 'some.module:some_function',
+            'niio-convert = niio.convert:main',
             ],
         },
     include_package_data=True,
@@ -56,6 +57,7 @@ setup(
             ]
         },
     install_requires=requirements,
+    python_requires='>=3.7',
     license="BSD (3-clause)",
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',